@@ -18,7 +18,10 @@ from typing import Dict, Set, List, Optional, Any
 logger = logging.getLogger('ddos_protection')
 
 # Global caches for ultra-fast lookups - used throughout the system
-# Use Python sets for O(1) lookup performance
+# Use Python sets for O(1) lookup performance. These must stay plain `set`
+# objects (never dicts or wrappers): the request hot path relies on
+# `ip in banned_ips_cache` being a single C-level lookup, which is also
+# lock-free for readers on free-threaded CPython builds.
 banned_ips_cache = set()
 banned_devices_cache = set()
 trusted_ips_cache = set()
@@ -28,6 +28,7 @@ import subprocess
 import ipaddress
 import traceback
 import sys
+import socket
 
 # Local imports
 from ddos_protection.config import Config
@@ -44,6 +45,13 @@ from ddos_protection.storage import ban_manager
 # Configure logger
 logger = logging.getLogger("ddos_protection.mitigator")
 
+# Optional netlink access to kernel ipsets (Linux only)
+try:
+    from pyroute2 import IPSet
+    PYROUTE2_AVAILABLE = True
+except ImportError:
+    PYROUTE2_AVAILABLE = False
+
 # إضافة فلتر لتقليل تكرار سجلات الحظر
 class DuplicateBlockFilter(logging.Filter):
     """فلتر لتجنب تكرار رسائل الحظر للعناوين IP المتكررة"""
@@ -966,14 +974,14 @@ class AttackMitigator:
             banned_ips = self.banned_ips.keys()
             count = 0
             for ip in banned_ips:
-                banned_ips_cache[ip] = True
+                banned_ips_cache.add(ip)
                 count += 1
             
             # Load trusted IPs
             trusted_ips = self.trusted_ips.keys()
             trusted_count = 0
             for ip in trusted_ips:
-                trusted_ips_cache[ip] = True
+                trusted_ips_cache.add(ip)
                 trusted_count += 1
                 
             logger.info(f"Preloaded {count} banned IPs and {trusted_count} trusted IPs into memory cache")
@@ -1079,7 +1087,7 @@ class AttackMitigator:
             try:
                 from ddos_protection import banned_ips_cache
                 if ip not in banned_ips_cache:
-                    banned_ips_cache[ip] = True  # Add to cache for future requests
+                    banned_ips_cache.add(ip)  # Add to cache for future requests
                     await asyncio.sleep(random.uniform(0.5, 2.0))
             except ImportError:
                 await asyncio.sleep(random.uniform(0.5, 2.0))
@@ -1702,6 +1710,10 @@ class DDoSMitigator:
     system-level firewall blocks and rate limiting.
     """
     
+    # ipset hash sets used for batched Linux firewall blocks
+    IPSET_NAME = 'ddos_blacklist'
+    IPSET_NAME_V6 = 'ddos_blacklist6'
+    
     def __init__(self):
         """Initialize the DDoS mitigator"""
         # Track mitigation actions
@@ -1717,6 +1729,13 @@ class DDoSMitigator:
         if not self.has_firewall:
             logger.warning("No firewall capability detected. Will use application-level blocking only.")
         
+        # ipset sets and their DROP rules are created lazily on the first batch;
+        # IPv4 and IPv6 readiness are tracked separately
+        self._ipset_ready = None
+        self._ipset6_ready = None
+        # Netlink ipset handle (pyroute2), used instead of spawning `ipset`
+        self._ipset = None
+        
         logger.info("DDoS mitigator initialized")
     
     def _detect_os(self) -> str:
@@ -1974,6 +1993,168 @@ class DDoSMitigator:
             logger.error(f"Error applying firewall block for IP {ip}: {e}")
             return False
     
+    async def _apply_system_firewall_blocks(self, ips: List[str]) -> int:
+        """
+        Apply system firewall blocks for a batch of IP addresses.
+        
+        On Linux the batch is loaded into a kernel ipset hash set matched by one
+        iptables rule: directly over netlink when pyroute2 is installed,
+        otherwise with a single `ipset restore` call. Elsewhere each IP falls
+        back to _apply_system_firewall_block.
+        
+        Args:
+            ips: IP addresses to block
+            
+        Returns:
+            int: Number of IPs blocked
+        """
+        if not hasattr(self, '_blocked_ips_set'):
+            self._blocked_ips_set = set()
+        
+        # Skip addresses that were already blocked
+        pending = [ip for ip in dict.fromkeys(ips) if ip not in self._blocked_ips_set]
+        if not pending:
+            return 0
+        
+        blocked = 0
+        if self.system_os == 'linux' and await self._ensure_ipset():
+            # Addresses whose family has no usable set fall through to per-IP rules
+            batch = [ip for ip in pending if self._ipset_name_for(ip)]
+            pending = [ip for ip in pending if not self._ipset_name_for(ip)]
+            
+            if self._ipset is not None:
+                added = [ip for ip in batch if self._netlink_ipset_add(ip)]
+                self._blocked_ips_set.update(added)
+                blocked += len(added)
+            elif batch:
+                lines = [f"add {self._ipset_name_for(ip)} {ip}" for ip in batch]
+                
+                try:
+                    process = await asyncio.create_subprocess_exec(
+                        'ipset', '-exist', 'restore',
+                        stdin=asyncio.subprocess.PIPE,
+                        stdout=asyncio.subprocess.PIPE,
+                        stderr=asyncio.subprocess.PIPE
+                    )
+                    stdout, stderr = await process.communicate(("\n".join(lines) + "\n").encode())
+                    
+                    if process.returncode == 0:
+                        self._blocked_ips_set.update(batch)
+                        blocked += len(batch)
+                    else:
+                        logger.error(f"ipset restore failed: {stderr.decode(errors='replace').strip()}")
+                except Exception as e:
+                    logger.error(f"Error applying batched firewall blocks: {e}")
+        
+        for ip in pending:
+            if await self._apply_system_firewall_block(ip):
+                blocked += 1
+        return blocked
+    
+    def _ipset_name_for(self, ip: str) -> Optional[str]:
+        """Return the ipset for an IP's address family, or None if that set is unusable"""
+        if ':' in ip:
+            return self.IPSET_NAME_V6 if self._ipset6_ready else None
+        return self.IPSET_NAME if self._ipset_ready else None
+    
+    async def _ensure_ipset(self) -> bool:
+        """
+        Create the ipset sets and their iptables DROP rules once.
+        
+        The IPv4 and IPv6 sets are set up independently, so a host without
+        ip6tables still gets batched IPv4 blocks.
+        
+        Returns:
+            bool: True if at least one address family can use its ipset
+        """
+        if self._ipset_ready is not None:
+            return self._ipset_ready or self._ipset6_ready
+        
+        if PYROUTE2_AVAILABLE:
+            try:
+                ipset = IPSet()
+                ipset.create(self.IPSET_NAME, stype='hash:ip', family=socket.AF_INET, exclusive=False)
+                ipset.create(self.IPSET_NAME_V6, stype='hash:ip', family=socket.AF_INET6, exclusive=False)
+                self._ipset = ipset
+            except Exception as e:
+                logger.warning(f"Netlink ipset unavailable, using the ipset command: {e}")
+                self._ipset = None
+        
+        families = [
+            (self.IPSET_NAME, 'iptables', []),
+            (self.IPSET_NAME_V6, 'ip6tables', ['family', 'inet6']),
+        ]
+        ready = []
+        for set_name, iptables, create_options in families:
+            commands = []
+            if self._ipset is None:
+                commands.append((['ipset', 'create', set_name, 'hash:ip', *create_options, '-exist'], None))
+            rule = ['-m', 'set', '--match-set', set_name, 'src', '-j', 'DROP']
+            commands.append(([iptables, '-I', 'INPUT', '1', *rule], [iptables, '-C', 'INPUT', *rule]))
+            ready.append(await self._run_ipset_setup(commands))
+        
+        self._ipset_ready, self._ipset6_ready = ready
+        if self._ipset_ready or self._ipset6_ready:
+            logger.info(f"Using ipset '{self.IPSET_NAME}' for batched firewall blocks "
+                        f"(IPv4: {self._ipset_ready}, IPv6: {self._ipset6_ready})")
+        else:
+            logger.warning("ipset not available, falling back to per-IP firewall rules")
+        
+        return self._ipset_ready or self._ipset6_ready
+    
+    async def _run_ipset_setup(self, commands: List[Tuple[List[str], Optional[List[str]]]]) -> bool:
+        """Run ipset/iptables setup commands in order, stopping at the first failure"""
+        try:
+            for cmd, check_cmd in commands:
+                # Don't insert the same DROP rule twice
+                if check_cmd:
+                    check = await asyncio.create_subprocess_exec(
+                        *check_cmd,
+                        stdout=asyncio.subprocess.PIPE,
+                        stderr=asyncio.subprocess.PIPE
+                    )
+                    await check.communicate()
+                    if check.returncode == 0:
+                        continue
+                
+                process = await asyncio.create_subprocess_exec(
+                    *cmd,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                stdout, stderr = await process.communicate()
+                if process.returncode != 0:
+                    logger.warning(f"ipset setup failed ({' '.join(cmd)}): {stderr.decode(errors='replace').strip()}")
+                    return False
+            return True
+        except Exception as e:
+            logger.warning(f"ipset setup failed: {e}")
+            return False
+    
+    def _netlink_ipset_add(self, ip: str) -> bool:
+        """Add an IP to the matching kernel ipset over netlink"""
+        try:
+            if ':' in ip:
+                self._ipset.add(self.IPSET_NAME_V6, ip, family=socket.AF_INET6, exclusive=False)
+            else:
+                self._ipset.add(self.IPSET_NAME, ip, family=socket.AF_INET, exclusive=False)
+            return True
+        except Exception as e:
+            logger.error(f"Error adding IP {ip} to ipset: {e}")
+            return False
+    
+    def _netlink_ipset_delete(self, ip: str) -> bool:
+        """Remove an IP from the matching kernel ipset over netlink"""
+        try:
+            if ':' in ip:
+                self._ipset.delete(self.IPSET_NAME_V6, ip, family=socket.AF_INET6, exclusive=False)
+            else:
+                self._ipset.delete(self.IPSET_NAME, ip, family=socket.AF_INET, exclusive=False)
+            return True
+        except Exception as e:
+            logger.error(f"Error removing IP {ip} from ipset: {e}")
+            return False
+    
     async def _ban_ip_in_storage(self, ip: str, reason: str, severity: str) -> bool:
         """Ban an IP in storage with appropriate duration based on severity"""
         try:
@@ -1993,10 +2174,7 @@ class DDoSMitigator:
             # Update global cache
             try:
                 from ddos_protection import banned_ips_cache
-                if hasattr(banned_ips_cache, 'add'):  # If it's a set
-                    banned_ips_cache.add(ip)
-                else:  # If it's a dict
-                    banned_ips_cache[ip] = True
+                banned_ips_cache.add(ip)
             except ImportError:
                 pass
                 
@@ -2039,11 +2217,8 @@ class DDoSMitigator:
                 # Update global cache
                 try:
                     from ddos_protection import banned_ips_cache
-                    if hasattr(banned_ips_cache, 'remove'):  # If it's a set
-                        banned_ips_cache.remove(ip)
-                    elif ip in banned_ips_cache:  # If it's a dict
-                        del banned_ips_cache[ip]
-                except (ImportError, KeyError):
+                    banned_ips_cache.discard(ip)
+                except ImportError:
                     pass
             
             return firewall_result or storage_result
@@ -2054,6 +2229,10 @@ class DDoSMitigator:
     
     async def _remove_firewall_block(self, ip: str) -> bool:
         """Remove a firewall block for an IP address"""
+        # Forget the block so a later ban applies it again
+        if hasattr(self, '_blocked_ips_set'):
+            self._blocked_ips_set.discard(ip)
+        
         try:
             if self.system_os == 'windows':
                 # Remove Windows Firewall rule
@@ -2074,7 +2253,23 @@ class DDoSMitigator:
                 return process.returncode == 0
                 
             elif self.system_os == 'linux':
-                # Remove iptables rule
+                # Remove the IP from its ipset; batched blocks live there.
+                # Set up the sets first, since another instance may have added the IP
+                ipset_removed = False
+                await self._ensure_ipset()
+                set_name = self._ipset_name_for(ip)
+                if set_name and self._ipset is not None:
+                    ipset_removed = self._netlink_ipset_delete(ip)
+                elif set_name:
+                    process = await asyncio.create_subprocess_exec(
+                        'ipset', 'del', set_name, ip, '-exist',
+                        stdout=asyncio.subprocess.PIPE,
+                        stderr=asyncio.subprocess.PIPE
+                    )
+                    stdout, stderr = await process.communicate()
+                    ipset_removed = process.returncode == 0
+                
+                # Remove any per-IP iptables rule from the fallback path
                 iptables_cmd = [
                     'iptables', '-D', 'INPUT', '-s', ip, '-j', 'DROP'
                 ]
@@ -2086,7 +2281,7 @@ class DDoSMitigator:
                 )
                 stdout, stderr = await process.communicate()
                 
-                return process.returncode == 0
+                return ipset_removed or process.returncode == 0
                 
             elif self.system_os == 'macos':
                 # Remove from pfctl
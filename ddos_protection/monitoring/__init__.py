@@ -31,13 +31,15 @@ except ImportError as e:
 
 # Apply OPTIONS patch to prevent blocking legitimate requests
 try:
-    from .options_patch import patch_ddos_system
-    # Call the patch function but don't halt on errors
-    try:
-        patch_ddos_system()
-        logger.info("Applied OPTIONS patch to DDoS protection system")
-    except Exception as e:
-        logger.error(f"Failed to apply OPTIONS patch: {e}")
+    from .options_patch import patch_ddos_system, AUTOPATCH
+    # Call the patch function but don't halt on errors; only with DDOS_AUTOPATCH=1,
+    # otherwise the server applies it via options_patch.init() at startup
+    if AUTOPATCH:
+        try:
+            patch_ddos_system()
+            logger.info("Applied OPTIONS patch to DDoS protection system")
+        except Exception as e:
+            logger.error(f"Failed to apply OPTIONS patch: {e}")
 except ImportError as e:
     logger.warning(f"OPTIONS patch not available: {e}")
 
@@ -36,6 +36,10 @@ class Monitor:
         self.last_alert_time = None
         self.alert_cooldown = self.config.monitor.alert_cooldown
         
+        # Previously observed values, used to feed counter deltas
+        self._last_blocked_total = 0
+        self._was_under_attack = False
+        
         # Configure logging
         self._setup_logging()
         
@@ -151,23 +155,26 @@ class Monitor:
             
         # Update metrics from detector
         if detector_status:
-            self.metrics["under_attack"].set(1 if detector_status.get("under_attack", False) else 0)
+            under_attack = detector_status.get("under_attack", False)
+            self.metrics["under_attack"].set(1 if under_attack else 0)
             self.metrics["attack_intensity"].set(detector_status.get("intensity", 0))
             self.metrics["suspicious_ips"].set(detector_status.get("suspicious_ip_count", 0))
             
             # If we just detected an attack, increment the counter
-            if detector_status.get("under_attack", False) and self.metrics["under_attack"]._value.get() == 0:
+            if under_attack and not self._was_under_attack:
                 self.metrics["attacks_total"].inc()
+            self._was_under_attack = under_attack
         
         # Update metrics from mitigator
         if mitigator_stats:
             self.metrics["blocked_ips"].set(mitigator_stats.get("blocked_ip_count", 0))
             
             # Update the delta for counters
-            prev_blocked = self.metrics["blocked_requests_total"]._value.get()
             new_blocked = mitigator_stats.get("blocked_requests", 0)
-            if new_blocked > prev_blocked:
-                self.metrics["blocked_requests_total"]._value.set(new_blocked)
+            delta = new_blocked - self._last_blocked_total
+            if delta > 0:
+                self.metrics["blocked_requests_total"].inc(delta)
+            self._last_blocked_total = new_blocked
     
     async def check_alerts(self, detector_status: Dict[str, Any]):
         """Check if any alerts should be sent based on current status."""
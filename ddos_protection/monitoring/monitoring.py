@@ -7,18 +7,76 @@ DDoS Protection System - Monitoring Module
 نظام مراقبة وحظر متقدم للحماية من هجمات DDoS
 """
 
+import ipaddress
 import logging
+import queue
 import threading
 import time
 import asyncio
-from typing import Dict, Set, List, Optional, Tuple
+from collections import Counter, deque
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Set, List, Optional, Tuple, Union
 
-# Import utility for IP validation
-from ddos_protection.utils import is_valid_ip
+# Import utility for IP validation and integer IP keys
+from ddos_protection.utils import ip_to_int
 
 # Setup logger
 logger = logging.getLogger('ddos_protection.monitoring')
 
+# Number of lock stripes for per-IP accounting (must be a power of two)
+LOCK_STRIPES = 64
+
+# Seconds to let queued firewall blocks accumulate before applying them as one batch
+FIREWALL_BATCH_INTERVAL = 0.25
+
+# How long an "allowed" decision for an (ip, device) pair is reused, and the
+# number of entries at which expired decisions are swept
+DECISION_CACHE_TTL = 5.0
+DECISION_CACHE_MAX_SIZE = 10000
+
+# How long a check_device_from_ip result is reused; device bans made by this
+# monitor drop the cached results straight away
+DEVICE_IP_CACHE_TTL = 30.0
+
+# IP patterns idle for longer than this many seconds are evicted by the sweeper,
+# which runs every PATTERN_SWEEP_INTERVAL seconds
+PATTERN_IDLE_TIMEOUT = 300
+PATTERN_SWEEP_INTERVAL = 60
+
+# Rate-limit bans are written behind by a background thread, which drains up
+# to BAN_BATCH_SIZE queued bans at a time, waiting at most BAN_BATCH_WAIT
+# seconds to fill a group
+BAN_BATCH_SIZE = 500
+BAN_BATCH_WAIT = 0.05
+RATE_LIMIT_BAN_DURATION = 86400
+
+@dataclass(slots=True)
+class IPPattern:
+    """Request pattern tracked per client IP"""
+    first_seen: float
+    last_seen: float
+    request_count: int = 0
+    post_count: int = 0
+    total_size: int = 0
+    # Only the last 10 intervals between requests are kept
+    intervals: deque = field(default_factory=lambda: deque(maxlen=10))
+    # Running sum and sum of squares over `intervals`
+    sum_intervals: float = 0.0
+    sum_intervals_sq: float = 0.0
+    # 256-bit bitmap of hashed paths; its popcount approximates the number of
+    # distinct paths without storing attacker-controlled strings
+    path_bitmap: int = 0
+    methods: Counter = field(default_factory=Counter)
+
+@dataclass(slots=True)
+class MonitorStats:
+    """Counters for statistics and reporting"""
+    blocked_requests: int = 0
+    blocked_ips: int = 0
+    blocked_devices: int = 0
+    suspicious_requests: int = 0
+    rate_limited: int = 0
+
 class MonitorSystem:
     """
     Advanced monitoring system for tracking and immediately blocking
@@ -57,26 +115,66 @@ class MonitorSystem:
             self.banned_ips_cache = set()
             self.banned_devices_cache = set()
         
-        # Lock for thread safety
-        self.lock = threading.RLock()
+        # Caches must be plain sets so membership checks stay a single C-level
+        # lookup (lock-free on free-threaded CPython builds)
+        if not isinstance(self.banned_ips_cache, set):
+            self.banned_ips_cache = set()
+        if not isinstance(self.banned_devices_cache, set):
+            self.banned_devices_cache = set()
+        self._ban_ip_cache_add = self.banned_ips_cache.add
+        self._ban_device_cache_add = self.banned_devices_cache.add
+        
+        # Banned CIDR ranges as {host bits: {ip key >> host bits}}, so a lookup
+        # costs one set check per distinct prefix length. Replaced (not mutated)
+        # on update so readers never see a dict change size mid-iteration.
+        self._banned_networks: Dict[int, Set[int]] = {}
+        
+        # Striped locks for per-IP accounting, so requests from different
+        # IPs don't serialize on a single global lock
+        self._stripes = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        
+        # Lock for statistics snapshots/resets
+        self._stats_lock = threading.Lock()
+        
+        # Firewall blocks are queued and applied in batches by a background worker
+        self._pending_fw_bans: queue.SimpleQueue = queue.SimpleQueue()
+        self._fw_worker: Optional[threading.Thread] = None
+        self._fw_worker_lock = threading.Lock()
+        self._fw_disabled = False
+        self._mitigator = None
         
         # Track last time IP rate limits were checked
         self.last_ip_check = {}
         
+        # Recent "not blocked" decisions: (ip key, device_fingerprint) -> expiry time.
+        # Lets repeat traffic skip the database checks in is_blocked.
+        self._decision_cache: Dict[Tuple[int, Optional[str]], float] = {}
+        
+        # Banned devices seen on an IP: ip key -> (expiry time, device fingerprints).
+        # Spares a device_manager query on every decision-cache miss.
+        self._device_ip_cache: Dict[int, Tuple[float, List[str]]] = {}
+        
         # Track IP request patterns
-        self.ip_patterns = {}
+        # (keyed by integer IP so different spellings of an address share one entry)
+        self.ip_patterns: Dict[int, IPPattern] = {}
         
         # Counters for statistics and reporting
-        self.stats = {
-            'blocked_requests': 0,
-            'blocked_ips': 0,
-            'blocked_devices': 0,
-            'suspicious_requests': 0
-        }
+        self.stats = MonitorStats()
         
         # Load existing banned IPs and devices into memory
         self._load_banned_entities()
         
+        # Rate-limit bans are written behind to the database by a background
+        # writer; the in-memory cache is updated immediately
+        self._ban_queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._ban_writer = threading.Thread(target=self._write_queued_bans, name="ddos-ban-writer", daemon=True)
+        self._ban_writer.start()
+        
+        # Evict idle IP patterns in the background so memory stays bounded
+        self._sweeper_stop = threading.Event()
+        self._sweeper = threading.Thread(target=self._sweep_ip_patterns, name="ddos-pattern-sweeper", daemon=True)
+        self._sweeper.start()
+        
         logger.info("Monitor system initialized")
     
     def _load_banned_entities(self):
@@ -85,10 +183,10 @@ class MonitorSystem:
         try:
             banned_ips = self.ban_manager.get_banned_ips()
             for ip in banned_ips:
-                if hasattr(self.banned_ips_cache, 'add'):  # If it's a set
-                    self.banned_ips_cache.add(ip)
-                else:  # If it's a dict
-                    self.banned_ips_cache[ip] = True
+                if '/' in ip:
+                    self._add_banned_network(ip)
+                else:
+                    self._ban_ip_cache_add(ip)
             logger.info(f"Loaded {len(banned_ips)} banned IPs into memory cache")
         except Exception as e:
             logger.error(f"Failed to load banned IPs: {e}")
@@ -97,14 +195,126 @@ class MonitorSystem:
         try:
             banned_devices = self.device_manager.get_banned_devices()
             for device in banned_devices:
-                if hasattr(self.banned_devices_cache, 'add'):  # If it's a set
-                    self.banned_devices_cache.add(device)
-                else:  # If it's a dict
-                    self.banned_devices_cache[device] = True
+                self._ban_device_cache_add(device)
             logger.info(f"Loaded {len(banned_devices)} banned devices into memory cache")
         except Exception as e:
             logger.error(f"Failed to load banned devices: {e}")
     
+    @staticmethod
+    def _network_key(net: Union[ipaddress.IPv4Network, ipaddress.IPv6Network]) -> Tuple[int, int]:
+        """Return the (host bits, ip key >> host bits) entry for a CIDR range"""
+        host_bits = net.max_prefixlen - net.prefixlen
+        return host_bits, ip_to_int(str(net.network_address)) >> host_bits
+    
+    def _add_banned_network(self, network: str) -> bool:
+        """Add a banned CIDR range; single-host ranges go to the banned IPs cache"""
+        try:
+            net = ipaddress.ip_network(network, strict=False)
+        except ValueError:
+            logger.warning(f"Ignoring invalid banned network: {network}")
+            return False
+        
+        if net.num_addresses == 1:
+            self._ban_ip_cache_add(str(net.network_address))
+            return True
+        
+        host_bits, key = self._network_key(net)
+        networks = {bits: set(keys) for bits, keys in self._banned_networks.items()}
+        networks.setdefault(host_bits, set()).add(key)
+        self._banned_networks = networks
+        return True
+    
+    def _remove_banned_network(self, network: str) -> bool:
+        """Remove a banned CIDR range; single-host ranges leave the banned IPs cache"""
+        try:
+            net = ipaddress.ip_network(network, strict=False)
+        except ValueError:
+            return False
+        
+        if net.num_addresses == 1:
+            self.banned_ips_cache.discard(str(net.network_address))
+            return True
+        
+        host_bits, key = self._network_key(net)
+        networks = {bits: set(keys) for bits, keys in self._banned_networks.items()}
+        keys = networks.get(host_bits)
+        if keys is None or key not in keys:
+            return False
+        keys.discard(key)
+        if not keys:
+            del networks[host_bits]
+        self._banned_networks = networks
+        return True
+    
+    def _refresh_banned_networks(self):
+        """Rebuild the banned CIDR ranges from storage, picking up bans and unbans made elsewhere"""
+        networks: Dict[int, Set[int]] = {}
+        for entry in self.ban_manager.get_banned_ips():
+            if '/' not in entry:
+                continue
+            try:
+                net = ipaddress.ip_network(entry, strict=False)
+            except ValueError:
+                continue
+            if net.num_addresses > 1:
+                host_bits, key = self._network_key(net)
+                networks.setdefault(host_bits, set()).add(key)
+        self._banned_networks = networks
+    
+    def ban_network(self, network: str, reason: str = "Banned network", duration: Optional[int] = None) -> bool:
+        """
+        Ban a CIDR range in storage and enforce it immediately.
+        
+        Args:
+            network: Range in CIDR notation (e.g. "203.0.113.0/24")
+            reason: Reason for the ban
+            duration: Ban duration in seconds (None for the storage default)
+            
+        Returns:
+            bool: True if the range was banned
+        """
+        try:
+            ipaddress.ip_network(network, strict=False)
+        except ValueError:
+            logger.warning(f"Ignoring invalid banned network: {network}")
+            return False
+        
+        # Store first so a concurrent resync from storage can't drop the range
+        try:
+            self.ban_manager.ban_ip(network, reason, duration)
+        except Exception as e:
+            logger.error(f"Failed to store ban for network {network}: {e}")
+        self._add_banned_network(network)
+        logger.warning(f"Banned network {network}: {reason}")
+        return True
+    
+    def unban_network(self, network: str) -> bool:
+        """
+        Lift a CIDR range ban in storage and stop enforcing it immediately.
+        
+        Args:
+            network: Range in CIDR notation
+            
+        Returns:
+            bool: True if the range was being enforced
+        """
+        # Remove from storage first so a concurrent resync can't restore the range
+        try:
+            self.ban_manager.unban_ip(network)
+        except Exception as e:
+            logger.error(f"Failed to remove stored ban for network {network}: {e}")
+        removed = self._remove_banned_network(network)
+        if removed:
+            logger.info(f"Unbanned network {network}")
+        return removed
+    
+    def _in_banned_network(self, ip_key: int) -> bool:
+        """Check if an integer IP key falls inside any banned CIDR range"""
+        for host_bits, keys in self._banned_networks.items():
+            if (ip_key >> host_bits) in keys:
+                return True
+        return False
+    
     def is_blocked(self, ip: str, device_fingerprint: Optional[str] = None, method: Optional[str] = None) -> bool:
         """
         Check if an IP or device is blocked using ultra-fast memory cache lookup.
@@ -118,69 +328,91 @@ class MonitorSystem:
             bool: True if the IP or device should be blocked
         """
         # Always check IP first (fastest check)
-        if not is_valid_ip(ip):
+        ip_key = ip_to_int(ip)
+        if ip_key is None:
             logger.warning(f"Invalid IP format detected: {ip}")
             return True  # Block invalid IPs
         
-        # Check banned IPs cache
-        if hasattr(self.banned_ips_cache, '__contains__'):  # If it's a set
-            if ip in self.banned_ips_cache:
-                self.stats['blocked_requests'] += 1
-                return True
-        else:  # If it's a dict
-            if ip in self.banned_ips_cache:
-                self.stats['blocked_requests'] += 1
-                return True
+        # Check banned IPs cache. This set lookup is already the cheapest
+        # "definitely not banned" answer available in CPython (the str hash is
+        # cached on the object), so no Bloom filter is placed in front of it.
+        if ip in self.banned_ips_cache:
+            self.stats.blocked_requests += 1
+            return True
+        
+        # Check banned CIDR ranges
+        if self._banned_networks and self._in_banned_network(ip_key):
+            self.stats.blocked_requests += 1
+            return True
+        
+        # Reuse a recent "allowed" decision unless the device has since been banned
+        decision_key = (ip_key, device_fingerprint)
+        now = time.monotonic()
+        expiry = self._decision_cache.get(decision_key)
+        if expiry is not None and expiry > now and device_fingerprint not in self.banned_devices_cache:
+            return False
         
         # Check DB if not in cache
         if self.ban_manager.is_banned(ip):
             # Add to cache for future checks
-            if hasattr(self.banned_ips_cache, 'add'):  # If it's a set
-                self.banned_ips_cache.add(ip)
-            else:  # If it's a dict
-                self.banned_ips_cache[ip] = True
-            self.stats['blocked_requests'] += 1
+            self._ban_ip_cache_add(ip)
+            self.stats.blocked_requests += 1
             return True
         
         # If we have a device fingerprint, check that too
         if device_fingerprint:
             # Check device cache first
-            if hasattr(self.banned_devices_cache, '__contains__'):  # If it's a set
-                if device_fingerprint in self.banned_devices_cache:
-                    # Ban this IP too if it's associated with a banned device
-                    self._ban_associated_ip(ip, device_fingerprint)
-                    self.stats['blocked_requests'] += 1
-                    return True
-            else:  # If it's a dict
-                if device_fingerprint in self.banned_devices_cache:
-                    # Ban this IP too if it's associated with a banned device
-                    self._ban_associated_ip(ip, device_fingerprint)
-                    self.stats['blocked_requests'] += 1
-                    return True
+            if device_fingerprint in self.banned_devices_cache:
+                # Ban this IP too if it's associated with a banned device
+                self._ban_associated_ip(ip, device_fingerprint)
+                self.stats.blocked_requests += 1
+                return True
             
             # Check DB if not in cache
             if self.device_manager.is_banned(device_fingerprint):
-                # Add to cache for future checks
-                if hasattr(self.banned_devices_cache, 'add'):  # If it's a set
-                    self.banned_devices_cache.add(device_fingerprint)
-                else:  # If it's a dict
-                    self.banned_devices_cache[device_fingerprint] = True
+                # Add to cache for future checks; IPs it used now count as tainted
+                self._ban_device_cache_add(device_fingerprint)
+                self._device_ip_cache.clear()
                 
                 # Ban this IP too if it's associated with a banned device
                 self._ban_associated_ip(ip, device_fingerprint)
-                self.stats['blocked_requests'] += 1
+                self.stats.blocked_requests += 1
                 return True
             
             # Check if this IP was used by any banned device
-            banned_devices = self.device_manager.check_device_from_ip(ip)
+            banned_devices = self._banned_devices_for_ip(ip, ip_key, now)
             if banned_devices:
                 # Ban this device too
-                self._ban_device_with_ip(device_fingerprint, ip, f"Using IP associated with banned devices: {','.join(banned_devices[:3])}")
-                self.stats['blocked_requests'] += 1
+                self._ban_device_with_ip(device_fingerprint, ip, banned_devices)
+                self.stats.blocked_requests += 1
                 return True
         
+        self._remember_allowed(decision_key, now)
         return False
     
+    def _remember_allowed(self, decision_key: Tuple[int, Optional[str]], now: float):
+        """Cache an "allowed" decision, sweeping expired entries when the cache grows too large"""
+        cache = self._decision_cache
+        if len(cache) >= DECISION_CACHE_MAX_SIZE:
+            for key in [k for k, expiry in list(cache.items()) if expiry <= now]:
+                cache.pop(key, None)
+            if len(cache) >= DECISION_CACHE_MAX_SIZE:
+                cache.clear()
+        cache[decision_key] = now + DECISION_CACHE_TTL
+    
+    def _banned_devices_for_ip(self, ip: str, ip_key: int, now: float) -> List[str]:
+        """Return the banned devices seen on an IP, reusing a recent lookup"""
+        cached = self._device_ip_cache.get(ip_key)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        
+        banned_devices = self.device_manager.check_device_from_ip(ip) or []
+        cache = self._device_ip_cache
+        if len(cache) >= DECISION_CACHE_MAX_SIZE:
+            cache.clear()
+        cache[ip_key] = (now + DEVICE_IP_CACHE_TTL, banned_devices)
+        return banned_devices
+    
     def _ban_associated_ip(self, ip: str, device_fingerprint: str):
         """Ban an IP associated with a banned device"""
         try:
@@ -191,15 +423,18 @@ class MonitorSystem:
             self._apply_firewall_block(ip)
             
             # Update stats
-            self.stats['blocked_ips'] += 1
+            self.stats.blocked_ips += 1
             
             logger.warning(f"Banned IP {ip} associated with banned device {device_fingerprint}")
         except Exception as e:
             logger.error(f"Failed to ban associated IP {ip}: {e}")
     
-    def _ban_device_with_ip(self, device_fingerprint: str, ip: str, reason: str):
-        """Ban a device and its associated IP"""
+    def _ban_device_with_ip(self, device_fingerprint: str, ip: str, banned_devices: List[str]):
+        """Ban a device and its associated IP, citing the banned devices seen on that IP"""
         try:
+            # Build the reason only now that a ban is actually being recorded
+            reason = f"Using IP associated with banned devices: {','.join(banned_devices[:3])}"
+            
             # Ban the device
             self.device_manager.ban_device(
                 device_fingerprint,
@@ -208,6 +443,8 @@ class MonitorSystem:
                 None,  # No browser fingerprint
                 None   # No user agent
             )
+            self._ban_device_cache_add(device_fingerprint)
+            self._device_ip_cache.clear()
             
             # Ban the IP
             self.ban_manager.ban_ip(ip, f"Associated with banned device {device_fingerprint}", 86400)
@@ -216,22 +453,56 @@ class MonitorSystem:
             self._apply_firewall_block(ip)
             
             # Update stats
-            self.stats['blocked_devices'] += 1
-            self.stats['blocked_ips'] += 1
+            self.stats.blocked_devices += 1
+            self.stats.blocked_ips += 1
             
-            logger.warning(f"Banned device {device_fingerprint} and IP {ip}: {reason}")
+            logger.warning("Banned device %s and IP %s: %s", device_fingerprint, ip, reason)
         except Exception as e:
             logger.error(f"Failed to ban device {device_fingerprint} with IP {ip}: {e}")
     
-    async def _apply_firewall_block(self, ip: str):
-        """Apply a firewall block to an IP address"""
+    def _apply_firewall_block(self, ip: str):
+        """Queue a firewall block for an IP address (applied in batches)"""
+        if self._fw_disabled:
+            return
+        
+        if self._fw_worker is None:
+            with self._fw_worker_lock:
+                if self._fw_worker is None:
+                    self._fw_worker = threading.Thread(
+                        target=self._firewall_worker,
+                        name="ddos-firewall-batcher",
+                        daemon=True
+                    )
+                    self._fw_worker.start()
+        
+        self._pending_fw_bans.put(ip)
+    
+    def _firewall_worker(self):
+        """Drain queued firewall blocks and apply them in batches"""
         try:
             from ddos_protection.core.mitigator import DDoSMitigator
-            mitigator = DDoSMitigator()
-            await mitigator._apply_system_firewall_block(ip)
-            logger.info(f"Applied firewall block to IP {ip}")
+            self._mitigator = DDoSMitigator()
         except Exception as e:
-            logger.error(f"Failed to apply firewall block to IP {ip}: {e}")
+            logger.error(f"Firewall blocking disabled, mitigator unavailable: {e}")
+            self._fw_disabled = True
+            return
+        
+        loop = asyncio.new_event_loop()
+        while True:
+            # Wait for work, then give the burst a moment to accumulate
+            batch = [self._pending_fw_bans.get()]
+            time.sleep(FIREWALL_BATCH_INTERVAL)
+            while True:
+                try:
+                    batch.append(self._pending_fw_bans.get_nowait())
+                except queue.Empty:
+                    break
+            
+            try:
+                blocked = loop.run_until_complete(self._mitigator._apply_system_firewall_blocks(batch))
+                logger.info(f"Applied firewall blocks to {blocked} of {len(batch)} queued IPs")
+            except Exception as e:
+                logger.error(f"Failed to apply firewall blocks to {len(batch)} IPs: {e}")
     
     def process_request_sync(self, ip: str, path: str, device_fingerprint: Optional[str] = None, 
                            user_agent: Optional[str] = None, request_size: int = 0, method: Optional[str] = None) -> bool:
@@ -253,11 +524,14 @@ class MonitorSystem:
         if self.is_blocked(ip, device_fingerprint, method):
             return False
         
+        # Read the clock once for pattern tracking and rate limiting
+        now = time.monotonic()
+        
         # Update request pattern data
-        self._update_request_pattern(ip, path, request_size, method)
+        self._update_request_pattern(ip, path, request_size, method, now)
         
         # Check for rate limiting - more aggressive for POST
-        if self._check_rate_limits(ip, device_fingerprint, method):
+        if self._check_rate_limits(ip, device_fingerprint, method, now):
             return False
         
         # Track relationship between device and IP
@@ -271,48 +545,74 @@ class MonitorSystem:
         
         return True
     
-    def _update_request_pattern(self, ip: str, path: str, request_size: int, method: Optional[str] = None):
-        """Update tracking data for IP request patterns"""
-        with self.lock:
-            current_time = time.time()
-            
-            if ip not in self.ip_patterns:
-                self.ip_patterns[ip] = {
-                    'first_seen': current_time,
-                    'last_seen': current_time,
-                    'request_count': 1,
-                    'paths': {path: 1},
-                    'methods': {method: 1} if method else {},
-                    'total_size': request_size,
-                    'intervals': []
-                }
+    def _lock_for(self, ip_key: int) -> threading.Lock:
+        """Get the lock stripe guarding an IP's pattern data"""
+        return self._stripes[hash(ip_key) & (LOCK_STRIPES - 1)]
+    
+    def _update_request_pattern(self, ip: str, path: str, request_size: int, method: Optional[str] = None,
+                                now: Optional[float] = None):
+        """Update tracking data for IP request patterns (`now` is a time.monotonic() reading)"""
+        ip_key = ip_to_int(ip)
+        if ip_key is None:
+            return
+        
+        current_time = time.monotonic() if now is None else now
+        
+        with self._lock_for(ip_key):
+            pattern = self.ip_patterns.get(ip_key)
+            if pattern is None:
+                pattern = self.ip_patterns[ip_key] = IPPattern(current_time, current_time)
             else:
-                pattern = self.ip_patterns[ip]
-                
-                # Calculate time since last request
-                if 'last_seen' in pattern:
-                    interval = current_time - pattern['last_seen']
-                    pattern['intervals'].append(interval)
-                    # Keep only last 10 intervals
-                    if len(pattern['intervals']) > 10:
-                        pattern['intervals'] = pattern['intervals'][-10:]
-                
-                # Update counters
-                pattern['last_seen'] = current_time
-                pattern['request_count'] = pattern.get('request_count', 0) + 1
+                # Calculate time since last request (deque drops the oldest interval)
+                intervals = pattern.intervals
+                if len(intervals) == intervals.maxlen:
+                    evicted = intervals[0]
+                    pattern.sum_intervals -= evicted
+                    pattern.sum_intervals_sq -= evicted * evicted
+                interval = current_time - pattern.last_seen
+                intervals.append(interval)
+                pattern.sum_intervals += interval
+                pattern.sum_intervals_sq += interval * interval
+                pattern.last_seen = current_time
+            
+            # Update counters
+            pattern.request_count += 1
+            pattern.total_size += request_size
+            pattern.path_bitmap |= 1 << (hash(path) & 255)
+            
+            # Track HTTP methods
+            if method:
+                pattern.methods[method] += 1
+                if method == 'POST':
+                    pattern.post_count += 1
+    
+    def _sweep_ip_patterns(self):
+        """Periodically evict idle IP patterns and resync banned CIDR ranges from storage"""
+        while not self._sweeper_stop.wait(PATTERN_SWEEP_INTERVAL):
+            try:
+                self._refresh_banned_networks()
+            except Exception as e:
+                logger.error(f"Failed to refresh banned networks: {e}")
+            
+            try:
+                cutoff = time.monotonic() - PATTERN_IDLE_TIMEOUT
+                evicted = 0
                 
-                # Track HTTP methods
-                if method:
-                    if 'methods' not in pattern:
-                        pattern['methods'] = {}
-                    pattern['methods'][method] = pattern['methods'].get(method, 0) + 1
+                # Snapshot the keys, then re-check each entry under its own stripe
+                for ip_key in list(self.ip_patterns):
+                    with self._lock_for(ip_key):
+                        pattern = self.ip_patterns.get(ip_key)
+                        if pattern is not None and pattern.last_seen < cutoff:
+                            del self.ip_patterns[ip_key]
+                            evicted += 1
                 
-                # Update path stats
-                if 'paths' not in pattern:
-                    pattern['paths'] = {}
-                pattern['paths'][path] = pattern['paths'].get(path, 0) + 1
+                if evicted:
+                    logger.debug("Evicted %d idle IP patterns (%d remaining)", evicted, len(self.ip_patterns))
+            except Exception as e:
+                logger.error(f"Failed to sweep IP patterns: {e}")
     
-    def _check_rate_limits(self, ip: str, device_fingerprint: Optional[str] = None, method: Optional[str] = None) -> bool:
+    def _check_rate_limits(self, ip: str, device_fingerprint: Optional[str] = None, method: Optional[str] = None,
+                           now: Optional[float] = None) -> bool:
         """
         Check if rate limits are exceeded.
         
@@ -320,29 +620,35 @@ class MonitorSystem:
             ip: Client IP address
             device_fingerprint: Optional device fingerprint
             method: HTTP method (GET, POST, etc.)
+            now: Current time.monotonic() reading (read here if not given)
             
         Returns:
             bool: True if request should be blocked, False if allowed
         """
-        with self.lock:
-            current_time = time.time()
-            
+        ip_key = ip_to_int(ip)
+        if ip_key is None:
+            return False
+        
+        current_time = time.monotonic() if now is None else now
+        
+        with self._lock_for(ip_key):
             # Check if IP pattern data exists
-            if ip not in self.ip_patterns:
+            pattern = self.ip_patterns.get(ip_key)
+            if pattern is None:
                 return False
-            
-            pattern = self.ip_patterns[ip]
-            duration = current_time - pattern['first_seen']
+
+            duration = current_time - pattern.first_seen
             
             # Calculate request rate (requests per second)
             if duration > 0:
-                request_rate = pattern['request_count'] / duration
+                request_rate = pattern.request_count / duration
             else:
-                request_rate = pattern['request_count']  # Avoid division by zero
+                request_rate = pattern.request_count  # Avoid division by zero
             
             # Check if method is POST and apply stricter limits
-            if method == 'POST' and 'methods' in pattern and 'POST' in pattern['methods']:
-                post_count = pattern['methods']['POST']
+            # (both POST rules below need more than 3 POST requests)
+            if method == 'POST' and pattern.post_count > 3:
+                post_count = pattern.post_count
                 
                 # More than 5 POST requests in under 5 seconds is suspicious
                 if post_count >= 5 and duration < 5:
@@ -351,36 +657,37 @@ class MonitorSystem:
                     return True
                 
                 # POST should be less than 30% of all requests for normal browsing
-                if post_count > 3 and (post_count / pattern['request_count']) > 0.3:
-                    logger.warning(f"Abnormal POST ratio: {ip} - {post_count}/{pattern['request_count']} requests are POST")
-                    self._ban_for_rate_limit(ip, f"Abnormal POST ratio: {post_count}/{pattern['request_count']} requests are POST")
+                if post_count > 3 and (post_count / pattern.request_count) > 0.3:
+                    logger.warning(f"Abnormal POST ratio: {ip} - {post_count}/{pattern.request_count} requests are POST")
+                    self._ban_for_rate_limit(ip, f"Abnormal POST ratio: {post_count}/{pattern.request_count} requests are POST")
                     return True
             
             # Standard rate limits
             
             # Check interval variance for bot detection
-            if len(pattern.get('intervals', [])) >= 5:
-                # Calculate standard deviation of request intervals
-                mean_interval = sum(pattern['intervals']) / len(pattern['intervals'])
-                variance = sum((x - mean_interval) ** 2 for x in pattern['intervals']) / len(pattern['intervals'])
-                std_dev = variance ** 0.5
+            interval_count = len(pattern.intervals)
+            if interval_count >= 5:
+                # Calculate standard deviation of request intervals from the running sums
+                mean_interval = pattern.sum_intervals / interval_count
+                variance = pattern.sum_intervals_sq / interval_count - mean_interval * mean_interval
+                std_dev = max(variance, 0.0) ** 0.5
                 
                 # Very low standard deviation indicates bot-like behavior
                 # Real humans have more variable intervals between requests
-                if mean_interval < 1.0 and std_dev < 0.1 and pattern['request_count'] > 10:
+                if mean_interval < 1.0 and std_dev < 0.1 and pattern.request_count > 10:
                     logger.warning(f"Bot-like behavior detected: {ip} - Consistent intervals between requests")
                     self._ban_for_rate_limit(ip, "Bot-like behavior: Too consistent request timing")
                     return True
             
             # General rate limits - allow burst for small numbers of requests
             # but be strict after they've made many requests
-            if pattern['request_count'] <= 10:
+            if pattern.request_count <= 10:
                 # Allow higher rates for initial requests
                 if request_rate > 10:  # More than 10 requests per second
                     logger.warning(f"High initial request rate: {ip} - {request_rate:.2f} req/s")
                     self._ban_for_rate_limit(ip, f"High initial request rate: {request_rate:.2f} req/s")
                     return True
-            elif pattern['request_count'] <= 50:
+            elif pattern.request_count <= 50:
                 # Medium strict for established sessions
                 if request_rate > 5:  # More than 5 requests per second
                     logger.warning(f"High sustained request rate: {ip} - {request_rate:.2f} req/s")
@@ -394,15 +701,16 @@ class MonitorSystem:
                     return True
             
             # Check path diversity - normal users don't access many different URLs quickly
-            if len(pattern['paths']) > 15 and duration < 10:
-                logger.warning(f"Suspicious path scanning: {ip} - {len(pattern['paths'])} paths in {duration:.2f}s")
-                self._ban_for_rate_limit(ip, f"Path scanning: {len(pattern['paths'])} paths in {duration:.2f}s")
+            path_count = pattern.path_bitmap.bit_count()
+            if path_count > 15 and duration < 10:
+                logger.warning(f"Suspicious path scanning: {ip} - ~{path_count} paths in {duration:.2f}s")
+                self._ban_for_rate_limit(ip, f"Path scanning: ~{path_count} paths in {duration:.2f}s")
                 return True
             
             # Check method diversity - normal users don't use many different HTTP methods
-            if 'methods' in pattern and len(pattern['methods']) >= 4 and duration < 30:
-                logger.warning(f"Suspicious method usage: {ip} - {len(pattern['methods'])} methods in {duration:.2f}s")
-                self._ban_for_rate_limit(ip, f"Unusual method usage: {len(pattern['methods'])} methods in {duration:.2f}s")
+            if len(pattern.methods) >= 4 and duration < 30:
+                logger.warning(f"Suspicious method usage: {ip} - {len(pattern.methods)} methods in {duration:.2f}s")
+                self._ban_for_rate_limit(ip, f"Unusual method usage: {len(pattern.methods)} methods in {duration:.2f}s")
                 return True
         
         return False
@@ -410,40 +718,57 @@ class MonitorSystem:
     def _ban_for_rate_limit(self, ip: str, reason: str):
         """Ban an IP for exceeding rate limits"""
         try:
-            # Ban in database
-            self.ban_manager.ban_ip(ip, f"Rate limit exceeded: {reason}", 86400)
+            # Add to banned cache (source of truth for later is_blocked checks)
+            self._ban_ip_cache_add(ip)
             
-            # Add to banned cache
-            if hasattr(self.banned_ips_cache, 'add'):  # If it's a set
-                self.banned_ips_cache.add(ip)
-            else:  # If it's a dict
-                self.banned_ips_cache[ip] = True
+            # Queue the database ban for the background writer
+            self._ban_queue.put((ip, f"Rate limit exceeded: {reason}", RATE_LIMIT_BAN_DURATION))
             
             # Apply firewall block
             self._apply_firewall_block(ip)
             
             # Update stats
-            self.stats['rate_limited'] = self.stats.get('rate_limited', 0) + 1
-            self.stats['blocked_ips'] += 1
+            self.stats.rate_limited += 1
+            self.stats.blocked_ips += 1
             
             logger.warning(f"Banned IP {ip} for rate limiting: {reason}")
         except Exception as e:
             logger.error(f"Failed to ban IP {ip} for rate limiting: {e}")
     
+    def _write_queued_bans(self):
+        """
+        Drain queued rate-limit bans and write them to the database.
+        
+        Bans are drained in groups, but the storage layer has no bulk API,
+        so each ban is still written with its own ban_ip call.
+        """
+        while True:
+            batch = [self._ban_queue.get()]
+            deadline = time.monotonic() + BAN_BATCH_WAIT
+            while len(batch) < BAN_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._ban_queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            
+            for ip, reason, duration in batch:
+                try:
+                    self.ban_manager.ban_ip(ip, reason, duration)
+                except Exception as e:
+                    logger.error(f"Failed to write rate-limit ban for IP {ip}: {e}")
+    
     def get_stats(self) -> Dict:
         """Get monitoring statistics"""
-        with self.lock:
-            return self.stats.copy()
+        with self._stats_lock:
+            return asdict(self.stats)
     
     def reset_stats(self):
         """Reset monitoring statistics"""
-        with self.lock:
-            self.stats = {
-                'blocked_requests': 0,
-                'blocked_ips': 0,
-                'blocked_devices': 0,
-                'suspicious_requests': 0
-            }
+        with self._stats_lock:
+            self.stats = MonitorStats()
 
 # Global instance for application-wide use
 monitor_system = MonitorSystem() 
\ No newline at end of file
@@ -16,14 +16,31 @@ import sys
 from typing import Dict, Any, Optional, Union, List
 import os
 import time
+import threading
 import traceback
 
+try:
+    from flask import request as _flask_request
+except ImportError:
+    _flask_request = None
+
 # Configure logger
 logger = logging.getLogger("ddos_protection.options_patch")
 
 # Flag to determine if we should use Cloudflare exclusively
 USE_CLOUDFLARE_EXCLUSIVELY = True
 
+# Background event loop shared with the Cloudflare client (set at patch time)
+_BG_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_BG_THREAD = None
+
+# Set once patch_ddos_system() has run in this process
+_PATCHED = False
+
+# Whether importing this package applies the patches (opt in with DDOS_AUTOPATCH=1);
+# by default the server calls init() explicitly at startup
+AUTOPATCH = os.environ.get("DDOS_AUTOPATCH", "0") == "1"
+
 def patch_ddos_system():
     """
     Apply patches to the DDoS protection system.
@@ -31,9 +48,20 @@ def patch_ddos_system():
     1. Not ban based on OPTIONS HTTP method
     2. Prioritize Cloudflare for banning
     3. Fix event loop conflicts
+    
+    Calling it again after the patches are applied does nothing.
     """
+    global _PATCHED
+    
+    if _PATCHED:
+        return
+    _PATCHED = True
+    
     logger.info("Applying DDoS protection system patches")
     
+    # Start the shared background loop used for Cloudflare calls
+    _start_background_loop()
+    
     # Patch ban_manager to prefer Cloudflare
     _patch_ban_manager()
     
@@ -43,67 +71,65 @@ def patch_ddos_system():
     # Patch asyncio to prevent event loop issues
     _patch_asyncio()
     
-    # Clean up any existing OPTIONS-related bans
-    _cleanup_options_bans()
+    # Clean up any existing OPTIONS-related bans off the startup path. The
+    # storage calls block, so they run in a worker thread; only the Cloudflare
+    # coroutine is scheduled on the shared loop
+    threading.Thread(target=_cleanup_options_bans, name="ddos-options-cleanup", daemon=True).start()
     
-    # Set environment variable to signal the patch is applied
-    os.environ["DDOS_PATCHED"] = "true"
+    # Signal Cloudflare-only mode; "already patched" is tracked per process
+    # by _PATCHED so child processes (e.g. the reloader's worker) patch too
     os.environ["USE_CLOUDFLARE_EXCLUSIVELY"] = "true"
     
     logger.info("DDoS protection system patches applied successfully")
 
+def _start_background_loop():
+    """Start the long-lived event loop that runs Cloudflare coroutines"""
+    global _BG_LOOP, _BG_THREAD
+    try:
+        from ddos_protection.network.cloudflare import api
+        
+        _BG_LOOP = api.get_background_loop()
+        _BG_THREAD = api._BG_THREAD
+        
+        # Make sure the loop actually picks up work before relying on it
+        try:
+            asyncio.run_coroutine_threadsafe(asyncio.sleep(0), _BG_LOOP).result(1.0)
+        except Exception:
+            logger.error("Background event loop is not running; Cloudflare calls will time out")
+    except Exception as e:
+        logger.error(f"Failed to start background event loop: {e}")
+
 def _patch_asyncio():
     """Patch asyncio to better handle event loop conflicts"""
     try:
-        # Store original functions
-        original_get_event_loop = asyncio.get_event_loop
+        # Bind the lookups once instead of resolving them on every call
+        get_running_loop = asyncio.get_running_loop
+        if sys.platform.startswith('win'):
+            new_event_loop = asyncio.SelectorEventLoop
+        else:
+            new_event_loop = asyncio.new_event_loop
         
         # Create a patched version that is more reliable
         def patched_get_event_loop():
             try:
                 # First try to get the running loop (the standard way)
-                return asyncio.get_running_loop()
+                return get_running_loop()
             except RuntimeError:
-                # If no running loop, fall back to the original behavior
-                try:
-                    return original_get_event_loop()
-                except RuntimeError:
-                    # No event loop exists, create a new one
-                    if sys.platform.startswith('win'):
-                        loop = asyncio.SelectorEventLoop()
-                    else:
-                        loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    return loop
+                pass
+                
+            # If no running loop, use the loop set for this thread
+            policy = asyncio.get_event_loop_policy()
+            try:
+                return policy.get_event_loop()
+            except RuntimeError:
+                # No event loop exists, create a new one
+                loop = new_event_loop()
+                policy.set_event_loop(loop)
+                return loop
             
         # Apply patch
         asyncio.get_event_loop = patched_get_event_loop
         
-        # Patch run_until_complete to handle errors better
-        original_run_until_complete = asyncio.BaseEventLoop.run_until_complete
-        
-        def patched_run_until_complete(self, future):
-            try:
-                return original_run_until_complete(self, future)
-            except RuntimeError as e:
-                # Handle "Cannot run the event loop while another loop is running"
-                if "another loop is running" in str(e):
-                    logger.warning("Detected nested event loop execution, attempting alternate approach")
-                    try:
-                        # Try to get the current running loop
-                        current_loop = asyncio.get_running_loop()
-                        # Create a task in the running loop instead
-                        future = asyncio.ensure_future(future, loop=current_loop)
-                        return future
-                    except Exception as inner_e:
-                        logger.error(f"Failed to handle nested event loop: {inner_e}")
-                        raise e
-                else:
-                    raise e  # Re-raise other RuntimeErrors
-        
-        # Apply the run_until_complete patch
-        asyncio.BaseEventLoop.run_until_complete = patched_run_until_complete
-        
         logger.info("Applied asyncio event loop patches successfully")
     except Exception as e:
         logger.error(f"Failed to patch asyncio: {e}")
@@ -113,77 +139,45 @@ def _patch_ban_manager():
     """Patch the ban_manager to prioritize Cloudflare."""
     try:
         from ddos_protection.storage import ban_manager
+        from ddos_protection.network.cloudflare.api import classify_reason, get_cf_client
+        cf_client = get_cf_client()
         
         # Store original method
         original_ban_ip = ban_manager.ban_ip
         
+        # Bind the client method once instead of resolving it per ban
+        _queue_block = cf_client.queue_block if cf_client else None
+        
         # Create a new method that only uses Cloudflare
         def patched_ban_ip(ip: str, reason: str = "Unknown", duration: Optional[int] = None) -> bool:
-            # Skip banning if the reason includes "OPTIONS" method
-            if "OPTIONS" in reason:
-                logger.info(f"Skipping ban for IP {ip} using OPTIONS method: {reason}")
-                return False
-                
-            # Skip fingerprinting or device ban related reasons
-            if "device" in reason.lower() or "fingerprint" in reason.lower():
-                logger.info(f"Skipping device-related ban for IP {ip}: {reason}")
+            # Skip OPTIONS method and device/fingerprint/tracking related bans
+            if classify_reason(reason):
+                logger.info("Skipping ban for IP %s: %s", ip, reason)
                 return False
                 
             # Always try Cloudflare but don't handle any local bans
             try:
-                # Import the Cloudflare client directly
-                from ddos_protection.network.cloudflare.api import cf_client
-                
-                if not cf_client:
+                if _queue_block is None:
                     logger.warning("Cloudflare client not available")
                     return False
                     
-                # Use direct API call instead of async
-                success = False
-                
                 try:
-                    # Create a new thread to handle the Cloudflare API call
-                    import threading
-                    
-                    result = {"success": False}
-                    
-                    def call_cloudflare():
-                        try:
-                            # Create a new event loop for this thread
-                            loop = asyncio.new_event_loop()
-                            asyncio.set_event_loop(loop)
-                            try:
-                                # Call the Cloudflare API
-                                cf_success, _ = loop.run_until_complete(cf_client.block_ip(ip, reason, duration or 86400))
-                                result["success"] = cf_success
-                            finally:
-                                loop.close()
-                        except Exception as e:
-                            logger.error(f"Thread error calling Cloudflare: {e}")
-                    
-                    # Start the thread and wait for it to finish
-                    t = threading.Thread(target=call_cloudflare)
-                    t.daemon = True
-                    t.start()
-                    t.join(timeout=5.0)  # Wait up to 5 seconds
-                    
-                    success = result["success"]
-                    
-                    if success:
-                        logger.info(f"Successfully blocked IP {ip} using Cloudflare")
+                    # Queue the block; the client sends queued IPs in bulk
+                    if _queue_block(ip, reason, duration or 86400):
+                        logger.debug("Queued Cloudflare block for IP %s", ip)
                     else:
-                        logger.warning(f"Failed to block IP {ip} using Cloudflare")
+                        logger.warning("Cloudflare block queue full, dropping block for IP %s", ip)
                     
                     # Always return True to bypass local banning
                     return True
                     
                 except Exception as e:
-                    logger.error(f"Error calling Cloudflare in thread: {e}")
+                    logger.error("Error queueing Cloudflare block: %s", e)
                     # Return True to avoid local bans even on error
                     return True
                     
             except Exception as e:
-                logger.error(f"Failed to send Cloudflare ban for IP {ip}: {e}")
+                logger.error("Failed to send Cloudflare ban for IP %s: %s", ip, e)
                 # Return True to bypass local banning
                 return True
             
@@ -194,20 +188,6 @@ def _patch_ban_manager():
         ban_manager.ban_ip = patched_ban_ip
         logger.info("ban_manager.ban_ip patched successfully - ONLY using Cloudflare")
         
-        # Also patch is_banned to prevent local checks
-        original_is_banned = ban_manager.is_banned
-        
-        def patched_is_banned(ip: str) -> bool:
-            # Only check if the IP is OPTIONS request
-            if ip.endswith("OPTIONS"):
-                return False
-            
-            # Allow normal check to pass through
-            return original_is_banned(ip)
-            
-        # Apply is_banned patch
-        ban_manager.is_banned = patched_is_banned
-        
     except ImportError as e:
         logger.error(f"Failed to patch ban_manager: {e}")
 
@@ -227,15 +207,15 @@ def _patch_early_ip_rejection():
             original_early_ip_rejection = server.early_ip_rejection
             
             # Define a wrapper function
-            def patched_early_ip_rejection():
+            def patched_early_ip_rejection(_orig=original_early_ip_rejection, _req=_flask_request):
                 # Skip processing for OPTIONS requests
-                from flask import request
-                if request.method == "OPTIONS":
-                    logger.debug(f"Allowing OPTIONS request from {request.remote_addr}")
+                if _req.method == "OPTIONS":
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Allowing OPTIONS request from %s", _req.remote_addr)
                     return None
                 
                 # Call original function for non-OPTIONS requests
-                return original_early_ip_rejection()
+                return _orig()
             
             # Replace the original function
             server.early_ip_rejection = patched_early_ip_rejection
@@ -258,14 +238,10 @@ def _cleanup_options_bans():
         banned_ips = ban_manager.get_banned_ips()
         
         # Check for any OPTIONS-related bans
-        options_bans = []
-        for ip, ban_info in banned_ips.items():
-            if "OPTIONS" in ban_info.get("reason", ""):
-                options_bans.append(ip)
+        options_bans = [ip for ip, ban_info in banned_ips.items() if "OPTIONS" in ban_info.get("reason", "")]
         
         # Remove any OPTIONS-related bans
         for ip in options_bans:
-            logger.info(f"Removing OPTIONS-related ban for IP {ip}")
             ban_manager.unban_ip(ip)
             
         if options_bans:
@@ -273,35 +249,21 @@ def _cleanup_options_bans():
             
         # Also try to clean up via Cloudflare
         try:
-            from ddos_protection.network.cloudflare.api import cf_client
+            from ddos_protection.network.cloudflare.api import get_cf_client, get_background_loop
+            cf_client = get_cf_client()
             if cf_client:
-                # Create a new thread to handle this
-                import threading
-                
-                def cleanup_cloudflare():
+                async def cleanup_cloudflare():
                     try:
-                        # Create a new event loop for this thread
-                        loop = asyncio.new_event_loop()
-                        asyncio.set_event_loop(loop)
-                        try:
-                            # Get Cloudflare bans list
-                            cf_bans = loop.run_until_complete(cf_client.list_blocked_ips())
-                            # Filter for OPTIONS bans
-                            for ip, info in cf_bans.items():
-                                if "OPTIONS" in info.get("reason", ""):
-                                    # Unblock the IP
-                                    success, _ = loop.run_until_complete(cf_client.unblock_ip(ip))
-                                    if success:
-                                        logger.info(f"Successfully removed OPTIONS-related ban for IP {ip} in Cloudflare")
-                        finally:
-                            loop.close()
+                        # The client scans Cloudflare only if it knows no OPTIONS bans yet
+                        results = await cf_client.cleanup_options_bans()
+                        for ip, success in results.items():
+                            if success:
+                                logger.info(f"Successfully removed OPTIONS-related ban for IP {ip} in Cloudflare")
                     except Exception as e:
                         logger.error(f"Error cleaning up Cloudflare bans: {e}")
                 
-                # Run the cleanup in a separate thread
-                thread = threading.Thread(target=cleanup_cloudflare)
-                thread.daemon = True
-                thread.start()
+                # Run the cleanup on the background loop without waiting for it
+                asyncio.run_coroutine_threadsafe(cleanup_cloudflare(), _BG_LOOP or get_background_loop())
         except Exception as e:
             logger.error(f"Failed to clean up Cloudflare bans: {e}")
             
@@ -309,9 +271,14 @@ def _cleanup_options_bans():
         logger.error(f"Failed to clean up OPTIONS-related bans: {e}")
 
 def init():
-    """Initialize the patch module."""
+    """
+    Initialize the patch module.
+    
+    Server entry points call this at startup, before handling requests.
+    Setting DDOS_AUTOPATCH=1 also runs it on import.
+    """
     patch_ddos_system()
 
-# Apply patches immediately when imported
-if __name__ != "__main__":
+# Apply patches on import only when opted in; repeat calls are no-ops
+if AUTOPATCH:
     init() 
\ No newline at end of file
@@ -8,11 +8,18 @@ DDoS Protection System - Network Components
 """
 
 # Import Cloudflare components only - system_firewall has been removed
-from .cloudflare import CloudflareAPIClient, cf_client
+from .cloudflare import CloudflareAPIClient, get_cf_client
 
 # Try to import additional Cloudflare components
 try:
     from .cloudflare import init_cloudflare_integration, CLOUDFLARE_ENABLED
     __all__ = ['CloudflareAPIClient', 'cf_client', 'init_cloudflare_integration', 'CLOUDFLARE_ENABLED']
 except ImportError:
-    __all__ = ['CloudflareAPIClient', 'cf_client']
\ No newline at end of file
+    __all__ = ['CloudflareAPIClient', 'cf_client']
+
+
+def __getattr__(name):
+    """Resolve `cf_client` lazily to the shared Cloudflare client."""
+    if name == 'cf_client':
+        return get_cf_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
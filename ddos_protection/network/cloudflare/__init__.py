@@ -14,17 +14,15 @@ bypassing local JSON storage and device fingerprinting systems.
 """
 
 import os
-import time
 import json
 import logging
-import threading
 import asyncio
 from typing import Dict, List, Optional, Union, Any
 from functools import wraps
 
 # Import API client explicitly to fix import error
 try:
-    from .api import CloudflareAPIClient, blocked_ips_cache
+    from .api import CloudflareAPIClient, blocked_ips_cache, get_background_loop, classify_reason, get_cf_client
 except ImportError as e:
     logging.getLogger('ddos_protection.cloudflare').error(f"Failed to import CloudflareAPIClient: {e}")
     # Create stub definitions if API is not available
@@ -32,6 +30,11 @@ except ImportError as e:
         def __init__(self, *args, **kwargs):
             pass
     blocked_ips_cache = set()
+    get_background_loop = None
+    def classify_reason(reason):
+        return 0
+    def get_cf_client():
+        return None
 
 # Configuration for Cloudflare API
 CF_API_EMAIL = os.environ.get('CF_API_EMAIL', '')
@@ -71,16 +74,16 @@ except ImportError:
     cf_blueprint = None
     register_cloudflare_routes = None
 
-# Global client instance
-cf_client = None
-
-# Initialize the cf_client
-try:
-    cf_client = CloudflareAPIClient(CF_API_EMAIL, CF_API_KEY, CF_ZONE_ID)
-    logger.info("Cloudflare API client created")
-except Exception as e:
-    logger.error(f"Error creating Cloudflare API client: {e}")
-    cf_client = None
+def __getattr__(name):
+    """
+    Resolve `cf_client` lazily to the shared client from api.get_cf_client().
+    
+    Nothing is created at import time, and every importer gets the same
+    client (and so the same bulk queue, rule index and block list).
+    """
+    if name == 'cf_client':
+        return get_cf_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def init_cloudflare_integration(app=None):
     """
@@ -92,10 +95,11 @@ def init_cloudflare_integration(app=None):
     Returns:
         bool: True if initialization was successful
     """
-    global cf_client, CLOUDFLARE_ENABLED
+    global CLOUDFLARE_ENABLED
     
     # Set environment variable to indicate Cloudflare is primary protection method
     os.environ['USE_CLOUDFLARE_EXCLUSIVELY'] = 'true'
+    cf_exclusive = os.environ['USE_CLOUDFLARE_EXCLUSIVELY'].lower() == 'true'
     
     # Check if we're in development mode
     dev_mode = CF_DEV_MODE
@@ -104,7 +108,7 @@ def init_cloudflare_integration(app=None):
     if dev_mode:
         # Create client instance in dev mode
         try:
-            from .api import CloudflareAPIClient, blocked_ips_cache
+            cf_client = get_cf_client()
             logger.info("Cloudflare integration initialized in DEVELOPMENT MODE")
             if app is not None and FLASK_AVAILABLE:
                 # Register routes with app
@@ -125,10 +129,11 @@ def init_cloudflare_integration(app=None):
     
     # Create client instance
     try:
-        from .api import CloudflareAPIClient, blocked_ips_cache
-        
-        # Normal mode with real credentials
-        cf_client = CloudflareAPIClient(CF_API_EMAIL, CF_API_KEY, CF_ZONE_ID)
+        # Normal mode with real credentials; the client is shared package-wide
+        cf_client = get_cf_client()
+        if cf_client is None:
+            logger.error("Cloudflare API client could not be created")
+            return False
         logger.info("Cloudflare API client initialized successfully")
         
         # Inject client to Flask app if provided
@@ -143,7 +148,7 @@ def init_cloudflare_integration(app=None):
             # In Cloudflare-only mode, we don't need to patch ban_manager
             # since all storage modules have been removed
             try:
-                if 'USE_CLOUDFLARE_EXCLUSIVELY' not in os.environ or os.environ['USE_CLOUDFLARE_EXCLUSIVELY'].lower() != 'true':
+                if not cf_exclusive:
                     integrate_with_ban_manager()
                     logger.info("Ban manager patched to use Cloudflare")
             except Exception as e:
@@ -185,8 +190,8 @@ def integrate_with_ban_manager():
     """Integrate Cloudflare client with ban manager"""
     try:
         from ddos_protection.storage import ban_manager
-        from .api import CloudflareAPIClient
         
+        cf_client = get_cf_client()
         if not cf_client:
             logger.warning("Cloudflare client not initialized")
             return False
@@ -195,44 +200,32 @@ def integrate_with_ban_manager():
         original_ban_ip = ban_manager.ban_ip
         original_unban_ip = ban_manager.unban_ip
         
+        # Bind the client methods once instead of resolving them per call
+        _queue_block = cf_client.queue_block
+        _unblock = cf_client.unblock_ip
+        
+        # Read once: whether a failed Cloudflare ban may fall back to local storage
+        cf_exclusive = os.environ.get('USE_CLOUDFLARE_EXCLUSIVELY', 'true').lower() == 'true'
+        
         # Create enhanced ban_ip method that uses Cloudflare
         def enhanced_ban_ip(ip, reason="Unknown", duration=None):
-            # Skip if it's an OPTIONS request
-            if "OPTIONS" in reason:
-                logger.info(f"Skipping ban for IP {ip} using OPTIONS method: {reason}")
-                return False
-                
-            # Skip tracking and fingerprinting related bans
-            if "device" in reason.lower() or "fingerprint" in reason.lower() or "tracking" in reason.lower():
-                logger.info(f"Skipping device-related ban for IP {ip}: {reason}")
+            # Skip OPTIONS requests and tracking/fingerprinting related bans
+            if classify_reason(reason):
+                logger.info("Skipping ban for IP %s: %s", ip, reason)
                 return False
                 
             # Always use Cloudflare and skip local storage
             try:
-                # Use event loop if one exists
-                try:
-                    loop = asyncio.get_event_loop()
-                    if loop.is_running():
-                        # Schedule it for later execution to avoid blocking
-                        asyncio.create_task(cf_client.block_ip(ip, reason, duration or 86400))
-                    else:
-                        # Run it now if loop is not running
-                        loop.run_until_complete(cf_client.block_ip(ip, reason, duration or 86400))
-                except RuntimeError:
-                    # No event loop, create one
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    try:
-                        loop.run_until_complete(cf_client.block_ip(ip, reason, duration or 86400))
-                    finally:
-                        loop.close()
+                # Queue the block; the client sends queued IPs in bulk
+                if not _queue_block(ip, reason, duration or 86400):
+                    raise RuntimeError("Cloudflare block queue is full")
                 
-                logger.info(f"IP {ip} banned via Cloudflare: {reason}")
+                logger.info("IP %s banned via Cloudflare: %s", ip, reason)
                 return True
             except Exception as e:
-                logger.error(f"Error banning IP through Cloudflare: {e}")
+                logger.error("Error banning IP through Cloudflare: %s", e)
                 # Fallback to local ban only if Cloudflare fails AND we're not explicitly set to use only Cloudflare
-                if os.environ.get('USE_CLOUDFLARE_EXCLUSIVELY', 'true').lower() != 'true':
+                if not cf_exclusive:
                     return original_ban_ip(ip, reason, duration)
                 return False
         
@@ -240,27 +233,17 @@ def integrate_with_ban_manager():
         def enhanced_unban_ip(ip):
             # Always try to unban in Cloudflare
             try:
-                # Use event loop if one exists
+                # Always run on the shared background loop, which owns the pooled session
+                future = asyncio.run_coroutine_threadsafe(_unblock(ip), get_background_loop())
                 try:
-                    loop = asyncio.get_event_loop()
-                    if loop.is_running():
-                        # Schedule it for later execution to avoid blocking
-                        asyncio.create_task(cf_client.unblock_ip(ip))
-                    else:
-                        # Run it now if loop is not running
-                        loop.run_until_complete(cf_client.unblock_ip(ip))
+                    asyncio.get_running_loop()
                 except RuntimeError:
-                    # No event loop, create one
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    try:
-                        loop.run_until_complete(cf_client.unblock_ip(ip))
-                    finally:
-                        loop.close()
+                    # Sync caller: wait for the result
+                    future.result(5.0)
                 
-                logger.info(f"IP {ip} unbanned from Cloudflare")
+                logger.info("IP %s unbanned from Cloudflare", ip)
             except Exception as e:
-                logger.error(f"Error unbanning IP from Cloudflare: {e}")
+                logger.error("Error unbanning IP from Cloudflare: %s", e)
             
             # Always try local unban too for consistency
             return original_unban_ip(ip)
@@ -280,8 +263,7 @@ async def sync_from_cloudflare():
     Synchronize banned IPs from Cloudflare to local system.
     This ensures consistency between Cloudflare and the local ban list.
     """
-    global cf_client
-    
+    cf_client = get_cf_client()
     if not cf_client:
         logger.warning("Cloudflare client not initialized")
         return False
@@ -294,30 +276,46 @@ async def sync_from_cloudflare():
             logger.info("No IPs banned in Cloudflare")
             return True
             
-        # Get local ban manager
+        # Get local ban manager; imported here so importing this package
+        # doesn't pull in the storage backend
         try:
             from ddos_protection.storage import ban_manager
-            from ddos_protection import banned_ips_cache
-            
-            # Sync banned IPs to local cache
-            for ip, info in cf_banned_ips.items():
-                # Add to banned_ips_cache if available
-                if hasattr(banned_ips_cache, 'add'):  # If it's a set
-                    banned_ips_cache.add(ip)
-                elif isinstance(banned_ips_cache, dict):  # If it's a dict
-                    banned_ips_cache[ip] = True
-                
-                # We don't need to call ban_ip since we're using Cloudflare exclusively
-            
-            logger.info(f"Synchronized {len(cf_banned_ips)} banned IPs from Cloudflare")
-            return True
         except ImportError:
             logger.warning("Local ban manager not available")
             return False
+            
+        # Looked up per sync because the package may rebind the cache
+        from ddos_protection import banned_ips_cache
+        
+        # Sync banned IPs to local cache in one bulk update
+        # (we don't need to call ban_ip since we're using Cloudflare exclusively)
+        if isinstance(banned_ips_cache, set):
+            banned_ips_cache.update(cf_banned_ips.keys())
+        elif isinstance(banned_ips_cache, dict):
+            banned_ips_cache.update(dict.fromkeys(cf_banned_ips, True))
+        
+        logger.info("Synchronized %d banned IPs from Cloudflare", len(cf_banned_ips))
+        return True
     except Exception as e:
-        logger.error(f"Error syncing from Cloudflare: {e}")
+        logger.error("Error syncing from Cloudflare: %s", e)
         return False
 
+async def _sync_forever(interval):
+    """
+    Run sync_from_cloudflare every `interval` seconds on the current loop.
+    
+    Args:
+        interval: Sync interval in seconds
+    """
+    while True:
+        try:
+            await sync_from_cloudflare()
+        except Exception as e:
+            logger.error(f"Error in periodic Cloudflare sync: {e}")
+            
+        # Sleep for the interval without blocking the loop
+        await asyncio.sleep(interval)
+
 def start_periodic_sync(interval=3600):
     """
     Start periodic synchronization with Cloudflare.
@@ -325,28 +323,13 @@ def start_periodic_sync(interval=3600):
     Args:
         interval: Sync interval in seconds (default: 1 hour)
     """
-    global cf_client
-    
-    if not cf_client:
+    if not get_cf_client():
         logger.warning("Cloudflare client not initialized")
         return False
         
     try:
-        def sync_job():
-            """Run sync job periodically"""
-            while True:
-                try:
-                    # Use asyncio.run for the sync task
-                    asyncio.run(sync_from_cloudflare())
-                except Exception as e:
-                    logger.error(f"Error in periodic Cloudflare sync: {e}")
-                    
-                # Sleep for the interval
-                time.sleep(interval)
-        
-        # Start sync thread
-        sync_thread = threading.Thread(target=sync_job, daemon=True)
-        sync_thread.start()
+        # Run on the shared background loop so client state persists between syncs
+        asyncio.run_coroutine_threadsafe(_sync_forever(interval), get_background_loop())
         
         logger.info(f"Started periodic Cloudflare sync (interval: {interval}s)")
         return True
@@ -12,25 +12,45 @@ Features:
 - List currently blocked IPs
 - Retrieve analytics data
 - Support for firewall rules
+- Block IPv4 addresses through one account IP List when CF_ACCOUNT_ID is set
 """
 
 import os
+import re
 import time
 import json
 import logging
+import random
 import asyncio
+import atexit
 import hmac
 import hashlib
-from typing import Dict, Tuple, List, Any, Optional, Set, Union
+from typing import AsyncIterator, Dict, Tuple, List, Any, Optional, Set, Union
 import ipaddress
 import aiohttp
 import threading
+
+# Optional faster JSON encoder/decoder for API requests and responses
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+from collections import OrderedDict, deque
+from itertools import count, islice
+from functools import lru_cache
 from datetime import datetime, timedelta
 
+from ddos_protection.utils import ip_to_int
+
 # Configure environment variables
 CF_API_EMAIL = os.environ.get('CF_API_EMAIL', '')
 CF_API_KEY = os.environ.get('CF_API_KEY', '')
 CF_ZONE_ID = os.environ.get('CF_ZONE_ID', '')
+CF_ACCOUNT_ID = os.environ.get('CF_ACCOUNT_ID', '')
+
+# Account IP List that holds blocked IPv4 addresses (used when CF_ACCOUNT_ID is set)
+CF_BLOCK_LIST_NAME = os.environ.get('CF_BLOCK_LIST_NAME', 'ddos_block_list')
 
 # Check if we're in development mode
 CF_DEV_MODE = os.environ.get('CF_DEV_MODE', 'false').lower() == 'true'
@@ -38,13 +58,208 @@ CF_DEV_MODE = os.environ.get('CF_DEV_MODE', 'false').lower() == 'true'
 # Configure logger
 logger = logging.getLogger('ddos_protection.cloudflare.api')
 
+# Bounds for the blocked IP cache
+BLOCK_CACHE_MAX = 200_000
+BLOCK_CACHE_TTL = 86400
+
+class _BlockCache:
+    """
+    Size-bounded cache of blocked IPs with per-entry expiry.
+    
+    Behaves like the set it replaces (`in`, add, remove, discard, len) so
+    callers elsewhere keep working. Addresses are stored as integer keys
+    (see ip_to_int), which are smaller and cheaper to hash than the text;
+    iteration yields the text form. Entries are spread over 16 shards, each
+    with its own lock for writes; membership checks are lock-free. A full
+    shard evicts its oldest entry, preferring an expired one, and is never
+    cleared in bulk, so a burst of new bans cannot unblock everyone else.
+    """
+    
+    SHARDS = 16
+    
+    def __init__(self, maxsize: int = BLOCK_CACHE_MAX, ttl: float = BLOCK_CACHE_TTL):
+        self._shard_max = max(1, maxsize // self.SHARDS)
+        self._ttl = ttl
+        self._shards = [(OrderedDict(), threading.Lock()) for _ in range(self.SHARDS)]
+    
+    @staticmethod
+    def _key(ip):
+        # Anything that does not parse as an address is stored as given
+        key = ip_to_int(ip) if isinstance(ip, str) else None
+        return ip if key is None else key
+    
+    @staticmethod
+    def _text(key):
+        if not isinstance(key, int):
+            return key
+        if key >> 128:
+            return str(ipaddress.IPv6Address(key ^ (1 << 128)))
+        return str(ipaddress.IPv4Address(key))
+    
+    def _shard(self, key):
+        return self._shards[hash(key) & (self.SHARDS - 1)]
+    
+    def add(self, ip, ttl: Optional[float] = None):
+        """Add or refresh an IP; it expires after `ttl` seconds."""
+        ip = self._key(ip)
+        entries, lock = self._shard(ip)
+        expires = time.monotonic() + (ttl or self._ttl)
+        with lock:
+            entries[ip] = expires
+            entries.move_to_end(ip)
+            if len(entries) > self._shard_max:
+                # Oldest entries are at the front; drop an expired one if
+                # there is one close by, otherwise the oldest
+                now = time.monotonic()
+                victim = next((key for key, exp in islice(entries.items(), 8) if exp <= now), None)
+                if victim is None:
+                    entries.popitem(last=False)
+                else:
+                    del entries[victim]
+    
+    def discard(self, ip):
+        ip = self._key(ip)
+        entries, lock = self._shard(ip)
+        with lock:
+            entries.pop(ip, None)
+    
+    def remove(self, ip):
+        ip = self._key(ip)
+        entries, lock = self._shard(ip)
+        with lock:
+            del entries[ip]
+    
+    def __contains__(self, ip) -> bool:
+        ip = self._key(ip)
+        expires = self._shard(ip)[0].get(ip)
+        if expires is None:
+            return False
+        if expires > time.monotonic():
+            return True
+        self.discard(ip)
+        return False
+    
+    def __len__(self) -> int:
+        return sum(len(entries) for entries, _ in self._shards)
+    
+    def __iter__(self):
+        for entries, lock in self._shards:
+            with lock:
+                keys = list(entries)
+            yield from map(self._text, keys)
+
 # Fast lookup cache to minimize API calls
-blocked_ips_cache: Set[str] = set()
+blocked_ips_cache = _BlockCache()
+
+# Extracts the address from a per-IP rule expression such as "(ip.src eq 1.2.3.4)"
+_IP_RE = re.compile(r'ip\.src eq ([0-9A-Fa-f:.]+)')
+
+# Seconds before a miss in the IP -> rule ID index (or in the block list's
+# IP -> item ID map) triggers a reload from Cloudflare
+RULE_INDEX_TTL = 60
+
+async def _read_json(response) -> Dict:
+    """
+    Decode a Cloudflare API response body, using orjson when available.
+    
+    Args:
+        response: aiohttp response
+        
+    Returns:
+        Dict: Decoded JSON body
+    """
+    if HAS_ORJSON:
+        return orjson.loads(await response.read())
+    return await response.json()
+
+# Ban reason flags returned by classify_reason()
+REASON_OPTIONS = 1
+REASON_DEVICE = 2
+REASON_FINGERPRINT = 4
+REASON_TRACKING = 8
+
+@lru_cache(maxsize=512)
+def classify_reason(reason: str) -> int:
+    """
+    Classify a ban reason into a bitmask of REASON_* flags.
+    
+    Reasons come from a small set of detector messages, so the result is
+    cached and repeated bans cost a single lookup.
+    
+    Args:
+        reason: Ban reason text
+        
+    Returns:
+        int: Bitwise OR of the matching REASON_* flags (0 if none)
+    """
+    r = reason.lower()
+    flags = 0
+    if "options" in r:
+        flags |= REASON_OPTIONS
+    if "device" in r:
+        flags |= REASON_DEVICE
+    if "fingerprint" in r:
+        flags |= REASON_FINGERPRINT
+    if "tracking" in r:
+        flags |= REASON_TRACKING
+    return flags
+
+# Long-lived event loop that runs client coroutines for synchronous callers
+_BG_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_BG_THREAD: Optional[threading.Thread] = None
+_BG_LOCK = threading.Lock()
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """
+    Get the shared background event loop, starting it on first use.
+    
+    Synchronous code submits coroutines to this loop with
+    asyncio.run_coroutine_threadsafe() instead of building a thread and a
+    new event loop for every call.
+    
+    Returns:
+        asyncio.AbstractEventLoop: Event loop running in a daemon thread
+    """
+    global _BG_LOOP, _BG_THREAD
+    
+    if _BG_LOOP is not None:
+        return _BG_LOOP
+        
+    with _BG_LOCK:
+        if _BG_LOOP is None:
+            loop = asyncio.new_event_loop()
+            
+            def run_loop():
+                asyncio.set_event_loop(loop)
+                loop.run_forever()
+            
+            _BG_THREAD = threading.Thread(target=run_loop, name="cloudflare-loop", daemon=True)
+            _BG_THREAD.start()
+            atexit.register(loop.call_soon_threadsafe, loop.stop)
+            _BG_LOOP = loop
+            
+    return _BG_LOOP
+
+# API requests: retries for timeouts, connection errors and these statuses
+REQUEST_RETRIES = 4
+REQUEST_RETRY_STATUSES = frozenset({429, 502, 503, 504})
+REQUEST_BACKOFF_MAX = 30
+
+# Bulk blocking: flush after this many queued IPs or this many seconds
+BULK_BLOCK_MAX = 100
+BULK_BLOCK_WAIT = 0.05
+# Batch size when queued blocks go to the IP List instead of firewall rules
+BULK_LIST_MAX = 1000
+# Queued blocks beyond this are rejected until the flusher catches up
+BULK_BLOCK_QUEUE_MAX = 10000
+
+# Successful blocks are logged as one summary line per interval (seconds)
+BLOCK_LOG_INTERVAL = 10
 
 class CloudflareAPIClient:
     """Cloudflare API client for DDoS protection."""
     
-    def __init__(self, email=CF_API_EMAIL, api_key=CF_API_KEY, zone_id=CF_ZONE_ID):
+    def __init__(self, email=CF_API_EMAIL, api_key=CF_API_KEY, zone_id=CF_ZONE_ID, account_id=CF_ACCOUNT_ID):
         """
         Initialize Cloudflare API client.
         
@@ -52,10 +267,12 @@ class CloudflareAPIClient:
             email: Cloudflare account email
             api_key: Cloudflare API key
             zone_id: Cloudflare zone ID
+            account_id: Cloudflare account ID; enables the IP List for IPv4 blocks
         """
         self.email = email
         self.api_key = api_key
         self.zone_id = zone_id
+        self.account_id = account_id
         self.base_url = "https://api.cloudflare.com/client/v4"
         
         # Define headers used for API requests
@@ -78,32 +295,214 @@ class CloudflareAPIClient:
             logger.info("Cloudflare API client initialized in DEVELOPMENT MODE (simulated API)")
             # In dev mode, store blocked IPs locally
             self.dev_blocked_ips = {}
+            self._dev_rule_seq = count(1)
         else:
             logger.info("Cloudflare API client initialized")
+            
+        # Blocks waiting for the next bulk request
+        self._pending_blocks = deque()
+        self._blocks_ready: Optional[asyncio.Event] = None
+        
+        # IPs seen with an OPTIONS-related rule, so cleanup can skip a full scan
+        self._options_banned: Set[str] = set()
+        
+        # Pooled HTTP sessions, one per event loop, created lazily on first use;
+        # sessions cannot be shared across loops
+        self._sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+        
+        # IP List mode: IPv4 blocks go into one list matched by a single rule
+        self.block_list_name = CF_BLOCK_LIST_NAME
+        self._block_list_id: Optional[str] = None
+        self._list_items: Dict[str, str] = {}  # IP -> list item ID
+        self._list_items_ts = 0.0
+        self._list_items_added: Set[str] = set()  # added since the last load, IDs unknown
+        
+        # IP -> firewall rule ID, loaded from the zone's rules on demand
+        self._rule_index: Dict[str, str] = {}
+        self._rule_index_ts = 0.0
+        
+        # Block/unblock requests in flight per IP, shared by concurrent callers
+        self._inflight_blocks: Dict[str, asyncio.Future] = {}
+        self._inflight_unblocks: Dict[str, asyncio.Future] = {}
+        
+        # Blocks since the last summary line, logged by a background task
+        self._block_counter = 0
+        self._block_summary = None
     
-    async def _check_rate_limit(self):
-        """Check and limit API request rate to avoid hitting Cloudflare limits."""
-        with self.lock:
-            current_time = time.time()
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """
+        Get the HTTP session for the running loop, creating it on first use.
+        
+        Connections to the API are pooled and kept alive between calls. A
+        session is tied to the event loop that created it, so each loop gets
+        its own and the background loop's session is never replaced.
+        
+        Returns:
+            aiohttp.ClientSession: Session with the API auth headers set
+        """
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            # Forget sessions whose loop is gone; they can no longer be used
+            for stale_loop in [l for l in self._sessions if l.is_closed()]:
+                del self._sessions[stale_loop]
+            
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=32,
+                    limit_per_host=16,
+                    ttl_dns_cache=300,
+                    keepalive_timeout=75,
+                    enable_cleanup_closed=True
+                ),
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=10, connect=3)
+            )
+            self._sessions[loop] = session
+        return session
+    
+    async def _request(self, method: str, url: str, **kwargs) -> Tuple[int, Dict]:
+        """
+        Send an API request, retrying transient failures with backoff.
+        
+        Timeouts, connection errors and 429/5xx responses are retried up to
+        REQUEST_RETRIES times, waiting for Retry-After when Cloudflare sends
+        it and for an exponential, jittered delay otherwise.
+        
+        Args:
+            method: HTTP method
+            url: Request URL
+            **kwargs: Passed on to aiohttp's request()
             
-            # Reset counter if reset interval has passed
-            if current_time - self.last_reset > self.reset_interval:
-                self.request_count = 0
-                self.last_reset = current_time
+        Returns:
+            Tuple[int, Dict]: (HTTP status, decoded response body)
+        """
+        session = await self._get_session()
+        
+        # Encode the body once with orjson; the session already sends the JSON content type
+        if HAS_ORJSON and "json" in kwargs:
+            kwargs["data"] = orjson.dumps(kwargs.pop("json"))
             
-            # Check if we've hit the limit
-            if self.request_count >= self.max_requests:
+        for attempt in range(REQUEST_RETRIES + 1):
+            retry_after = None
+            try:
+                async with session.request(method, url, **kwargs) as response:
+                    if response.status not in REQUEST_RETRY_STATUSES or attempt == REQUEST_RETRIES:
+                        return response.status, await _read_json(response)
+                    retry_after = response.headers.get("Retry-After")
+            except (asyncio.TimeoutError, aiohttp.ClientError):
+                if attempt == REQUEST_RETRIES:
+                    raise
+                    
+            if retry_after and retry_after.isdigit():
+                delay = min(int(retry_after), REQUEST_BACKOFF_MAX)
+            else:
+                delay = min(2 ** attempt, REQUEST_BACKOFF_MAX) + random.random()
+            logger.warning(f"Retrying Cloudflare {method} request in {delay:.1f} seconds")
+            await asyncio.sleep(delay)
+    
+    async def close(self):
+        """Close the HTTP sessions, each on the loop that owns it."""
+        loop = asyncio.get_running_loop()
+        sessions, self._sessions = self._sessions, {}
+        for session_loop, session in sessions.items():
+            if session.closed or session_loop.is_closed():
+                continue
+            if session_loop is loop:
+                await session.close()
+            elif session_loop.is_running():
+                await asyncio.wrap_future(
+                    asyncio.run_coroutine_threadsafe(session.close(), session_loop))
+    
+    def _count_blocks(self, blocked: int = 1):
+        """
+        Record successful blocks for the periodic summary log.
+        
+        Args:
+            blocked: Number of IPs blocked
+        """
+        self._block_counter += blocked
+        if self._block_summary is None:
+            self._block_summary = asyncio.run_coroutine_threadsafe(
+                self._log_block_summary(), get_background_loop()
+            )
+    
+    async def _log_block_summary(self):
+        """Log the number of blocked IPs every BLOCK_LOG_INTERVAL seconds."""
+        last = time.time()
+        while True:
+            await asyncio.sleep(BLOCK_LOG_INTERVAL)
+            blocked, self._block_counter = self._block_counter, 0
+            now = time.time()
+            if blocked:
+                logger.info("Blocked %d IPs in last %ds", blocked, now - last)
+            last = now
+    
+    async def _check_rate_limit(self):
+        """Check and limit API request rate to avoid hitting Cloudflare limits."""
+        while True:
+            # The lock only guards the counters and is never held across an
+            # await, so waiting callers don't block the ones that have budget
+            with self.lock:
+                current_time = time.time()
+                
+                # Reset counter if reset interval has passed
+                if current_time - self.last_reset > self.reset_interval:
+                    self.request_count = 0
+                    self.last_reset = current_time
+                
+                # Take a request from the budget if any is left
+                if self.request_count < self.max_requests:
+                    self.request_count += 1
+                    return
+                    
                 # Wait until reset
                 wait_time = self.reset_interval - (current_time - self.last_reset)
-                if wait_time > 0:
-                    logger.warning(f"Cloudflare API rate limit reached, waiting {wait_time:.2f} seconds")
-                    await asyncio.sleep(wait_time)
-                    # Reset counter
-                    self.request_count = 0
-                    self.last_reset = time.time()
+                
+            logger.warning(f"Cloudflare API rate limit reached, waiting {wait_time:.2f} seconds")
+            await asyncio.sleep(max(wait_time, 0))
+    
+    async def _coalesce(self, inflight: Dict[str, asyncio.Future], ip_address: str, operation):
+        """
+        Run operation() once for concurrent calls about the same IP.
+        
+        Callers on the same event loop that arrive while a request for the
+        IP is in flight wait for its result instead of sending their own.
+        
+        Args:
+            inflight: Map of IP -> future for requests in flight
+            ip_address: IP address the operation is for
+            operation: Callable returning the coroutine to run
+            
+        Returns:
+            The operation's result
+        """
+        loop = asyncio.get_running_loop()
+        future = inflight.get(ip_address)
+        if future is not None and future.get_loop() is loop:
+            return await asyncio.shield(future)
             
-            # Increment counter
-            self.request_count += 1
+        future = loop.create_future()
+        inflight[ip_address] = future
+        try:
+            result = await operation()
+            future.set_result(result)
+            return result
+        except Exception as e:
+            # Waiters see the leader's error, not a CancelledError of their own
+            future.set_exception(e)
+            # Mark it retrieved so an unawaited future doesn't log a warning
+            future.exception()
+            raise
+        except BaseException:
+            # The leader itself was cancelled; fail the waiters without
+            # making them look cancelled too
+            future.set_exception(RuntimeError(f"Cloudflare request for IP {ip_address} was cancelled"))
+            future.exception()
+            raise
+        finally:
+            if inflight.get(ip_address) is future:
+                del inflight[ip_address]
     
     async def block_ip(self, ip_address: str, reason: str, duration: int = 86400) -> Tuple[bool, Dict]:
         """
@@ -119,19 +518,24 @@ class CloudflareAPIClient:
         """
         global blocked_ips_cache
         
+        flags = classify_reason(reason) if reason else 0
+        
         # Skip OPTIONS requests
-        if reason and "OPTIONS" in reason:
-            logger.info(f"Skipping block for IP {ip_address} using OPTIONS request: {reason}")
+        if flags & REASON_OPTIONS:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Skipping block for IP %s using OPTIONS request: %s", ip_address, reason)
             return True, {"success": True, "message": "Skipped OPTIONS request block"}
             
         # Skip device/fingerprint related blocks when using Cloudflare exclusively
-        if reason and ("device" in reason.lower() or "fingerprint" in reason.lower()):
-            logger.info(f"Skipping device-related block for IP {ip_address}: {reason}")
+        if flags & (REASON_DEVICE | REASON_FINGERPRINT):
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Skipping device-related block for IP %s: %s", ip_address, reason)
             return True, {"success": True, "message": "Skipped device-related block"}
         
         # Check if IP is already blocked (avoid unnecessary API calls)
         if ip_address in blocked_ips_cache:
-            logger.debug(f"IP {ip_address} already blocked in Cloudflare")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("IP %s already blocked in Cloudflare", ip_address)
             return True, {"success": True, "message": "IP already blocked"}
         
         # Development mode - simulate API call
@@ -142,10 +546,17 @@ class CloudflareAPIClient:
                 "reason": reason,
                 "added": time.time(),
                 "duration": duration,
-                "rule_id": f"dev-rule-{int(time.time())}-{hash(ip_address) % 10000}"
+                "rule_id": f"dev-rule-{next(self._dev_rule_seq)}"
             }
             return True, {"success": True, "message": f"IP {ip_address} blocked (simulated in dev mode)"}
             
+        return await self._coalesce(
+            self._inflight_blocks, ip_address,
+            lambda: self._send_block(ip_address, reason, duration)
+        )
+    
+    async def _send_block(self, ip_address: str, reason: str, duration: int) -> Tuple[bool, Dict]:
+        """Create the Cloudflare block for an IP; see block_ip()."""
         # Avoid rate limit issues
         await self._check_rate_limit()
         
@@ -156,6 +567,11 @@ class CloudflareAPIClient:
             except ValueError:
                 logger.error(f"Invalid IP address: {ip_address}")
                 return False, {"success": False, "message": "Invalid IP address"}
+                
+            # IPv4 addresses go into the shared block list
+            if self._uses_block_list(ip_address):
+                success = await self._add_to_block_list([(ip_address, reason, duration)])
+                return success, {"success": success}
             
             # Check if rule already exists
             rule_id = await self._find_rule_by_ip(ip_address)
@@ -172,36 +588,188 @@ class CloudflareAPIClient:
             expression = f"(ip.src eq {ip_address})"
             
             # Make request to Cloudflare API
-            async with aiohttp.ClientSession() as session:
-                url = f"{self.base_url}/zones/{self.zone_id}/firewall/rules"
+            url = f"{self.base_url}/zones/{self.zone_id}/firewall/rules"
+            
+            # Prepare data
+            data = {
+                "name": f"Block {ip_address} - {int(time.time())}",
+                "description": description,
+                "action": "block",
+                "filter": {
+                    "expression": expression,
+                    "paused": False
+                },
+                "products": ["firewall"]
+            }
+            
+            # Send request
+            _, result = await self._request("POST", url, json=data)
+            
+            # Check if request was successful
+            if result.get("success", False):
+                blocked_ips_cache.add(ip_address)
+                self._count_blocks()
+                rule_id = (result.get("result") or {}).get("id")
+                if rule_id:
+                    self._rule_index[ip_address] = rule_id
+                return True, result
+            else:
+                logger.error(f"Failed to block IP {ip_address} in Cloudflare: {result.get('errors', [])}")
+                return False, result
+        except Exception as e:
+            logger.error(f"Error blocking IP {ip_address} in Cloudflare: {e}")
+            return False, {"success": False, "message": str(e)}
+    
+    def queue_block(self, ip_address: str, reason: str, duration: int = 86400) -> bool:
+        """
+        Queue an IP to be blocked with the next bulk request.
+        
+        Safe to call from any thread. Queued IPs are sent by _bulk_flusher()
+        on the shared background loop, so callers never wait on the API.
+        
+        Args:
+            ip_address: IP address to block
+            reason: Reason for blocking
+            duration: Duration in seconds (default: 24 hours)
+            
+        Returns:
+            bool: False if the queue is full and the block was rejected
+        """
+        if len(self._pending_blocks) >= BULK_BLOCK_QUEUE_MAX:
+            return False
+            
+        self._pending_blocks.append((ip_address, reason, duration))
+        
+        loop = get_background_loop()
+        if self._blocks_ready is None:
+            with _BG_LOCK:
+                if self._blocks_ready is None:
+                    self._blocks_ready = asyncio.Event()
+                    asyncio.run_coroutine_threadsafe(self._bulk_flusher(), loop)
+                    
+        loop.call_soon_threadsafe(self._blocks_ready.set)
+        return True
+    
+    async def _bulk_flusher(self):
+        """Send queued blocks to Cloudflare in batches of up to BULK_BLOCK_MAX IPs."""
+        batch_max = BULK_LIST_MAX if self.account_id else BULK_BLOCK_MAX
+        
+        while True:
+            await self._blocks_ready.wait()
+            self._blocks_ready.clear()
+            
+            # Give bans arriving together a moment to join the same batch
+            if len(self._pending_blocks) < batch_max:
+                await asyncio.sleep(BULK_BLOCK_WAIT)
+                
+            while self._pending_blocks:
+                batch = []
+                while self._pending_blocks and len(batch) < batch_max:
+                    batch.append(self._pending_blocks.popleft())
+                    
+                try:
+                    await self.block_ips_bulk(batch)
+                except Exception as e:
+                    logger.error(f"Error flushing queued Cloudflare blocks: {e}")
+    
+    async def block_ips_bulk(self, batch: List[Tuple[str, str, int]]) -> Dict[str, bool]:
+        """
+        Block several IP addresses with a single Cloudflare API request.
+        
+        If Cloudflare rejects the batch with a 4xx error (for example because
+        one of the rules already exists), each IP is retried with block_ip().
+        
+        Args:
+            batch: List of (ip_address, reason, duration) tuples
+            
+        Returns:
+            Dict[str, bool]: Whether each IP ended up blocked
+        """
+        global blocked_ips_cache
+        
+        results = {}
+        pending = []
+        for ip_address, reason, duration in batch:
+            if ip_address in results:
+                continue
                 
-                # Prepare data
-                data = {
-                    "name": f"Block {ip_address} - {int(time.time())}",
-                    "description": description,
-                    "action": "block",
-                    "filter": {
-                        "expression": expression,
-                        "paused": False
-                    },
-                    "products": ["firewall"]
-                }
+            # Skipped reasons, cached IPs and dev mode are cheap in block_ip
+            if (self.dev_mode or ip_address in blocked_ips_cache or
+                    (reason and classify_reason(reason) & (REASON_OPTIONS | REASON_DEVICE | REASON_FINGERPRINT))):
+                results[ip_address], _ = await self.block_ip(ip_address, reason, duration)
+                continue
                 
-                # Send request
-                async with session.post(url, headers=self.headers, json=data) as response:
-                    result = await response.json()
+            try:
+                ipaddress.ip_address(ip_address)
+            except ValueError:
+                logger.error(f"Invalid IP address: {ip_address}")
+                results[ip_address] = False
+                continue
+                
+            results[ip_address] = False
+            pending.append((ip_address, reason, duration))
+            
+        # IPv4 addresses go into the shared block list in one request
+        if self.account_id:
+            list_entries = [entry for entry in pending if self._uses_block_list(entry[0])]
+            if list_entries:
+                success = await self._add_to_block_list(list_entries)
+                for ip_address, _, _ in list_entries:
+                    results[ip_address] = success
+                pending = [entry for entry in pending if not self._uses_block_list(entry[0])]
+                
+        if not pending:
+            return results
+            
+        # Avoid rate limit issues
+        await self._check_rate_limit()
+        
+        # Create firewall rules to block the IPs
+        max_reason_length = 128
+        now = int(time.time())
+        rules = [
+            {
+                "name": f"Block {ip_address} - {now}",
+                "description": f"DDoS Protection: {reason[:max_reason_length]}" if reason else "DDoS Protection",
+                "action": "block",
+                "filter": {
+                    "expression": f"(ip.src eq {ip_address})",
+                    "paused": False
+                },
+                "products": ["firewall"]
+            }
+            for ip_address, reason, _ in pending
+        ]
+        
+        status = 0
+        try:
+            url = f"{self.base_url}/zones/{self.zone_id}/firewall/rules"
+            status, result = await self._request("POST", url, json=rules)
+            
+            if result.get("success", False):
+                for ip_address, _, _ in pending:
+                    blocked_ips_cache.add(ip_address)
+                    results[ip_address] = True
                     
-                    # Check if request was successful
-                    if result.get("success", False):
-                        logger.info(f"Successfully blocked IP {ip_address} in Cloudflare")
-                        blocked_ips_cache.add(ip_address)
-                        return True, result
-                    else:
-                        logger.error(f"Failed to block IP {ip_address} in Cloudflare: {result.get('errors', [])}")
-                        return False, result
+                # Record the new rules in the rule index
+                for rule in result.get("result") or []:
+                    ip_match = _IP_RE.search(rule.get("filter", {}).get("expression", ""))
+                    if ip_match:
+                        self._rule_index[ip_match.group(1)] = rule.get("id")
+                self._count_blocks(len(pending))
+                return results
+                
+            logger.warning(f"Cloudflare rejected bulk block of {len(pending)} IPs: {result.get('errors', [])}")
         except Exception as e:
-            logger.error(f"Error blocking IP {ip_address} in Cloudflare: {e}")
-            return False, {"success": False, "message": str(e)}
+            logger.error(f"Error bulk blocking IPs in Cloudflare: {e}")
+            return results
+            
+        # Retry one by one only when the batch itself was rejected
+        if 400 <= status < 500 and status != 429:
+            for ip_address, reason, duration in pending:
+                results[ip_address], _ = await self.block_ip(ip_address, reason, duration)
+                
+        return results
     
     async def unblock_ip(self, ip_address: str) -> Tuple[bool, Dict]:
         """
@@ -218,159 +786,458 @@ class CloudflareAPIClient:
         # Development mode - simulate API call
         if self.dev_mode:
             logger.info(f"[DEV MODE] Simulating unblocking IP {ip_address}")
-            if ip_address in blocked_ips_cache:
-                blocked_ips_cache.remove(ip_address)
+            blocked_ips_cache.discard(ip_address)
             if ip_address in self.dev_blocked_ips:
                 del self.dev_blocked_ips[ip_address]
             return True, {"success": True, "message": f"IP {ip_address} unblocked (simulated in dev mode)"}
         
+        return await self._coalesce(
+            self._inflight_unblocks, ip_address,
+            lambda: self._send_unblock(ip_address)
+        )
+    
+    async def _send_unblock(self, ip_address: str) -> Tuple[bool, Dict]:
+        """Remove the Cloudflare block for an IP; see unblock_ip()."""
         # Avoid rate limit issues
         await self._check_rate_limit()
         
         try:
+            # Addresses in the block list are removed from it; anything else
+            # may still have a per-IP rule from before the list was used
+            if self._uses_block_list(ip_address):
+                removed = await self._remove_from_block_list(ip_address)
+                if removed is not None:
+                    return removed, {"success": removed}
+                    
             # Find the rule ID for the IP
             rule_id = await self._find_rule_by_ip(ip_address)
             
             if not rule_id:
                 logger.warning(f"IP {ip_address} not found in Cloudflare rules")
                 # Remove from cache anyway
-                if ip_address in blocked_ips_cache:
-                    blocked_ips_cache.remove(ip_address)
+                blocked_ips_cache.discard(ip_address)
+                self._options_banned.discard(ip_address)
                 return True, {"success": True, "message": "IP not found in Cloudflare rules"}
                 
             # Delete the rule
-            async with aiohttp.ClientSession() as session:
-                url = f"{self.base_url}/zones/{self.zone_id}/firewall/rules/{rule_id}"
+            url = f"{self.base_url}/zones/{self.zone_id}/firewall/rules/{rule_id}"
+            _, result = await self._request("DELETE", url)
+            
+            if result.get("success", False):
+                logger.info(f"Successfully unblocked IP {ip_address} in Cloudflare")
                 
-                async with session.delete(url, headers=self.headers) as response:
-                    result = await response.json()
+                # Remove from cache
+                blocked_ips_cache.discard(ip_address)
+                self._options_banned.discard(ip_address)
+                self._rule_index.pop(ip_address, None)
                     
-                    if result.get("success", False):
-                        logger.info(f"Successfully unblocked IP {ip_address} in Cloudflare")
-                        
-                        # Remove from cache
-                        if ip_address in blocked_ips_cache:
-                            blocked_ips_cache.remove(ip_address)
-                            
-                        return True, result
-                    else:
-                        logger.error(f"Failed to unblock IP {ip_address} in Cloudflare: {result.get('errors', [])}")
-                        return False, result
+                return True, result
+            else:
+                logger.error(f"Failed to unblock IP {ip_address} in Cloudflare: {result.get('errors', [])}")
+                return False, result
         except Exception as e:
             logger.error(f"Error unblocking IP {ip_address} in Cloudflare: {e}")
             return False, {"success": False, "message": str(e)}
     
-    async def _find_rule_by_ip(self, ip_address: str) -> Optional[str]:
+    def _uses_block_list(self, ip_address: str) -> bool:
+        """IPv4 addresses are kept in the IP List when an account ID is configured."""
+        return bool(self.account_id) and ":" not in ip_address
+    
+    async def _ensure_block_list(self) -> Optional[str]:
         """
-        Find firewall rule ID for an IP address.
+        Find or create the account IP List used for blocks.
+        
+        The list is only cached once the zone firewall rule that blocks every
+        address in it is known to exist; a missing rule is created, so a list
+        left behind by an earlier failed setup still gets enforced.
+        
+        Returns:
+            Optional[str]: List ID, or None if the list could not be set up
+        """
+        if self._block_list_id:
+            return self._block_list_id
+            
+        url = f"{self.base_url}/accounts/{self.account_id}/rules/lists"
+        _, result = await self._request("GET", url)
+        
+        if not result.get("success", False):
+            logger.error(f"Failed to fetch Cloudflare IP lists: {result.get('errors', [])}")
+            return None
+            
+        list_id = next(
+            (item.get("id") for item in result.get("result", []) if item.get("name") == self.block_list_name),
+            None
+        )
+        
+        if list_id is None:
+            data = {
+                "name": self.block_list_name,
+                "kind": "ip",
+                "description": "DDoS Protection block list"
+            }
+            _, result = await self._request("POST", url, json=data)
+            
+            if not result.get("success", False):
+                logger.error(f"Failed to create Cloudflare IP list {self.block_list_name}: {result.get('errors', [])}")
+                return None
+                
+            list_id = result["result"]["id"]
+            logger.info(f"Created Cloudflare IP list {self.block_list_name}")
+            
+        # Without its rule the list blocks nothing, so don't report blocks as applied
+        if not await self._ensure_block_list_rule():
+            return None
+            
+        self._block_list_id = list_id
+        return list_id
+    
+    async def _ensure_block_list_rule(self) -> bool:
+        """
+        Make sure the zone firewall rule matching the block list exists.
+        
+        Returns:
+            bool: True if the rule exists or was created
+        """
+        expression = f"(ip.src in ${self.block_list_name})"
+        
+        try:
+            async for rule in self._iter_rules():
+                if rule.get("filter", {}).get("expression", "") == expression:
+                    return True
+        except Exception as e:
+            logger.error(f"Error checking Cloudflare block list rule: {e}")
+            return False
+            
+        # One rule blocks every address in the list
+        success, _ = await self.create_firewall_rule(expression, "block", "DDoS Protection: block list")
+        if not success:
+            logger.error(f"Failed to create the firewall rule for Cloudflare IP list {self.block_list_name}")
+        return success
+    
+    async def _add_to_block_list(self, entries: List[Tuple[str, str, int]]) -> bool:
+        """
+        Add IPv4 addresses to the block list with a single request.
         
         Args:
-            ip_address: IP address to find
+            entries: List of (ip_address, reason, duration) tuples
             
         Returns:
-            Optional[str]: Rule ID if found, None otherwise
+            bool: True if Cloudflare accepted the items
         """
+        global blocked_ips_cache
+        
+        list_id = await self._ensure_block_list()
+        if not list_id:
+            return False
+            
         # Avoid rate limit issues
         await self._check_rate_limit()
         
-        try:
-            # Find firewall rule for the IP
-            async with aiohttp.ClientSession() as session:
-                # Use paging to get all rules (100 per page)
-                page = 1
-                per_page = 100
+        max_reason_length = 128
+        items = [
+            {
+                "ip": ip_address,
+                "comment": f"DDoS Protection: {reason[:max_reason_length]}" if reason else "DDoS Protection"
+            }
+            for ip_address, reason, _ in entries
+        ]
+        
+        url = f"{self.base_url}/accounts/{self.account_id}/rules/lists/{list_id}/items"
+        _, result = await self._request("POST", url, json=items)
+        
+        if not result.get("success", False):
+            logger.error(f"Failed to add {len(items)} IPs to Cloudflare IP list: {result.get('errors', [])}")
+            return False
+            
+        for ip_address, _, _ in entries:
+            blocked_ips_cache.add(ip_address)
+            self._list_items_added.add(ip_address)
+            
+        self._count_blocks(len(items))
+        return True
+    
+    async def _load_block_list_items(self) -> Dict[str, str]:
+        """
+        Load every item of the block list and refresh the IP -> item ID map.
+        
+        Returns:
+            Dict[str, str]: IP addresses in the list and their comments
+        """
+        list_id = await self._ensure_block_list()
+        if not list_id:
+            return {}
+            
+        url = f"{self.base_url}/accounts/{self.account_id}/rules/lists/{list_id}/items"
+        
+        comments = {}
+        item_ids = {}
+        cursor = None
+        while True:
+            # Avoid rate limit issues
+            await self._check_rate_limit()
+            
+            params = {"cursor": cursor} if cursor else None
+            _, result = await self._request("GET", url, params=params)
+            
+            if not result.get("success", False):
+                logger.error(f"Failed to fetch Cloudflare IP list items: {result.get('errors', [])}")
+                break
                 
-                while True:
-                    url = f"{self.base_url}/zones/{self.zone_id}/firewall/rules?page={page}&per_page={per_page}"
+            for item in result.get("result", []):
+                ip = item.get("ip")
+                if ip:
+                    item_ids[ip] = item.get("id")
+                    comments[ip] = item.get("comment", "")
                     
-                    async with session.get(url, headers=self.headers) as response:
-                        result = await response.json()
-                        
-                        if not result.get("success", False):
-                            logger.error(f"Failed to fetch firewall rules: {result.get('errors', [])}")
-                            return None
-                            
-                        # Check if any rule matches the IP
-                        rules = result.get("result", [])
-                        for rule in rules:
-                            # Check if rule targets our IP
-                            filter_expr = rule.get("filter", {}).get("expression", "")
-                            if f"ip.src eq {ip_address}" in filter_expr:
-                                return rule.get("id")
-                        
-                        # Check if there are more pages
-                        result_info = result.get("result_info", {})
-                        if page >= result_info.get("total_pages", 0) or not rules:
-                            break
-                            
-                        # Move to next page
-                        page += 1
+            # Follow the cursor to the next page
+            cursor = result.get("result_info", {}).get("cursors", {}).get("after")
+            if not cursor:
+                break
                 
+        self._list_items = item_ids
+        self._list_items_ts = time.time()
+        self._list_items_added.clear()
+        return comments
+    
+    async def _remove_from_block_list(self, ip_address: str) -> Optional[bool]:
+        """
+        Remove an IPv4 address from the block list.
+        
+        Args:
+            ip_address: IP address to remove
+            
+        Returns:
+            Optional[bool]: None if the IP is not in the list, otherwise
+            whether it was removed
+        """
+        global blocked_ips_cache
+        
+        # Items added since the last load have no known ID yet and force a
+        # reload; other misses reload at most once per RULE_INDEX_TTL seconds
+        item_id = self._list_items.get(ip_address)
+        if item_id is None:
+            if (ip_address not in self._list_items_added
+                    and time.time() - self._list_items_ts <= RULE_INDEX_TTL):
                 return None
+            await self._load_block_list_items()
+            item_id = self._list_items.get(ip_address)
+            if item_id is None:
+                return None
+                
+        # Avoid rate limit issues
+        await self._check_rate_limit()
+        
+        url = f"{self.base_url}/accounts/{self.account_id}/rules/lists/{self._block_list_id}/items"
+        _, result = await self._request("DELETE", url, json={"items": [{"id": item_id}]})
+        
+        if not result.get("success", False):
+            logger.error(f"Failed to remove IP {ip_address} from Cloudflare IP list: {result.get('errors', [])}")
+            return False
+            
+        self._list_items.pop(ip_address, None)
+        blocked_ips_cache.discard(ip_address)
+        self._options_banned.discard(ip_address)
+        
+        logger.info(f"Successfully unblocked IP {ip_address} in Cloudflare")
+        return True
+    
+    async def unblock_ips_bulk(self, ip_addresses: List[str], concurrency: int = 4) -> Dict[str, bool]:
+        """
+        Unblock several IP addresses concurrently.
+        
+        Cloudflare deletes firewall rules one at a time, so this runs the
+        unblock_ip() calls together with at most `concurrency` in flight.
+        
+        Args:
+            ip_addresses: IP addresses to unblock
+            concurrency: Maximum number of simultaneous requests
+            
+        Returns:
+            Dict[str, bool]: Whether each IP was unblocked
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def unblock(ip_address):
+            async with semaphore:
+                success, _ = await self.unblock_ip(ip_address)
+                return success
+                
+        results = await asyncio.gather(*(unblock(ip) for ip in ip_addresses), return_exceptions=True)
+        return {
+            ip: result is True
+            for ip, result in zip(ip_addresses, results)
+        }
+    
+    async def cleanup_options_bans(self) -> Dict[str, bool]:
+        """
+        Remove the blocks created for OPTIONS requests.
+        
+        Uses the IPs already known to have an OPTIONS-related rule. When none
+        are known, for example after a restart, the blocked IPs are listed
+        from Cloudflare first, which fills that index.
+        
+        Returns:
+            Dict[str, bool]: Whether each OPTIONS-related block was removed
+        """
+        if not self._options_banned:
+            await self.list_blocked_ips()
+            
+        options_ips = list(self._options_banned)
+        if not options_ips:
+            return {}
+            
+        # Unblock all OPTIONS-related bans concurrently
+        return await self.unblock_ips_bulk(options_ips)
+    
+    async def _iter_rules(self, per_page: int = 100) -> AsyncIterator[Dict]:
+        """
+        Yield the zone's firewall rules, fetching one page at a time.
+        
+        Args:
+            per_page: Rules requested per page
+            
+        Yields:
+            Dict: Firewall rule as returned by the API
+            
+        Raises:
+            RuntimeError: If Cloudflare reports a failed request
+        """
+        page = 1
+        
+        while True:
+            # Avoid rate limit issues
+            await self._check_rate_limit()
+            
+            url = f"{self.base_url}/zones/{self.zone_id}/firewall/rules?page={page}&per_page={per_page}"
+            
+            _, result = await self._request("GET", url)
+            
+            if not result.get("success", False):
+                raise RuntimeError(f"Failed to fetch firewall rules: {result.get('errors', [])}")
+                
+            rules = result.get("result", [])
+            for rule in rules:
+                yield rule
+                
+            # Check if there are more pages
+            result_info = result.get("result_info", {})
+            if page >= result_info.get("total_pages", 0) or not rules:
+                return
+                
+            # Move to next page
+            page += 1
+    
+    async def _refresh_rule_index(self) -> bool:
+        """
+        Reload the IP -> rule ID index from all of the zone's firewall rules.
+        
+        Returns:
+            bool: True if every page was fetched
+        """
+        try:
+            index = {}
+            
+            # Index every rule that targets a single IP
+            async for rule in self._iter_rules():
+                ip_match = _IP_RE.search(rule.get("filter", {}).get("expression", ""))
+                if ip_match:
+                    index[ip_match.group(1)] = rule.get("id")
+                    
+            self._rule_index = index
+            self._rule_index_ts = time.time()
+            return True
         except Exception as e:
-            logger.error(f"Error finding rule for IP {ip_address}: {e}")
-            return None
+            logger.error(f"Error loading firewall rules: {e}")
+            return False
+    
+    async def _find_rule_by_ip(self, ip_address: str) -> Optional[str]:
+        """
+        Find firewall rule ID for an IP address.
+        
+        Lookups are served from the rule index; a miss reloads the index
+        only if it is older than RULE_INDEX_TTL seconds.
+        
+        Args:
+            ip_address: IP address to find
+            
+        Returns:
+            Optional[str]: Rule ID if found, None otherwise
+        """
+        rule_id = self._rule_index.get(ip_address)
+        if rule_id or time.time() - self._rule_index_ts <= RULE_INDEX_TTL:
+            return rule_id
+            
+        await self._refresh_rule_index()
+        return self._rule_index.get(ip_address)
     
     async def get_blocked_ips(self) -> List[Dict]:
         """
         Get list of blocked IPs in Cloudflare.
         
+        Covers both per-IP firewall rules and, when an account ID is set, the
+        items of the block list. List entries have no rule ID.
+        
         Returns:
             List[Dict]: List of blocked IPs with rule details
         """
         global blocked_ips_cache
         
-        # Avoid rate limit issues
-        await self._check_rate_limit()
-        
+        # Scan the firewall rules and the IP list items alongside them
+        fetches = [self._get_rule_blocked_ips()]
+        if self.account_id:
+            fetches.append(self._load_block_list_items())
         try:
-            # Get all firewall rules
-            async with aiohttp.ClientSession() as session:
-                # Use paging to get all rules (100 per page)
-                page = 1
-                per_page = 100
-                blocked_ips = []
+            blocked_ips, *list_items = await asyncio.gather(*fetches)
+        except Exception as e:
+            logger.error(f"Error fetching blocked IPs: {e}")
+            return []
+            
+        # Addresses blocked through the IP list
+        if list_items:
+            for ip, comment in list_items[0].items():
+                blocked_ips.append({
+                    "ip": ip,
+                    "rule_id": None,
+                    "description": comment,
+                    "created_on": None
+                })
+                blocked_ips_cache.add(ip)
                 
-                while True:
-                    url = f"{self.base_url}/zones/{self.zone_id}/firewall/rules?page={page}&per_page={per_page}"
+        return blocked_ips
+    
+    async def _get_rule_blocked_ips(self) -> List[Dict]:
+        """
+        Get the IPs blocked by per-IP firewall rules and refresh the rule index.
+        
+        Returns:
+            List[Dict]: List of blocked IPs with rule details
+        """
+        try:
+            blocked_ips = []
+            rule_index = {}
+            
+            # Find rules that block IPs
+            async for rule in self._iter_rules():
+                # Check if rule targets an IP and extract the address
+                ip_match = _IP_RE.search(rule.get("filter", {}).get("expression", ""))
+                if ip_match:
+                    ip = ip_match.group(1)
+                    blocked_ips.append({
+                        "ip": ip,
+                        "rule_id": rule.get("id"),
+                        "description": rule.get("description", ""),
+                        "created_on": rule.get("created_on")
+                    })
                     
-                    async with session.get(url, headers=self.headers) as response:
-                        result = await response.json()
-                        
-                        if not result.get("success", False):
-                            logger.error(f"Failed to fetch firewall rules: {result.get('errors', [])}")
-                            return []
-                            
-                        # Find rules that block IPs
-                        rules = result.get("result", [])
-                        for rule in rules:
-                            # Check if rule targets an IP
-                            filter_expr = rule.get("filter", {}).get("expression", "")
-                            if "ip.src eq " in filter_expr:
-                                # Extract IP address
-                                import re
-                                ip_match = re.search(r'ip\.src eq (\d+\.\d+\.\d+\.\d+)', filter_expr)
-                                if ip_match:
-                                    ip = ip_match.group(1)
-                                    blocked_ips.append({
-                                        "ip": ip,
-                                        "rule_id": rule.get("id"),
-                                        "description": rule.get("description", ""),
-                                        "created_on": rule.get("created_on")
-                                    })
-                                    
-                                    # Update cache
-                                    blocked_ips_cache.add(ip)
-                        
-                        # Check if there are more pages
-                        result_info = result.get("result_info", {})
-                        if page >= result_info.get("total_pages", 0) or not rules:
-                            break
-                            
-                        # Move to next page
-                        page += 1
-                
-                return blocked_ips
+                    # Update caches
+                    blocked_ips_cache.add(ip)
+                    rule_index[ip] = rule.get("id")
+                    
+            # A full scan is as good as a refresh of the rule index
+            self._rule_index = rule_index
+            self._rule_index_ts = time.time()
+            
+            return blocked_ips
         except Exception as e:
             logger.error(f"Error fetching blocked IPs: {e}")
             return []
@@ -392,32 +1259,30 @@ class CloudflareAPIClient:
         
         try:
             # Make request to Cloudflare API
-            async with aiohttp.ClientSession() as session:
-                url = f"{self.base_url}/zones/{self.zone_id}/firewall/rules"
-                
-                # Prepare data
-                data = {
-                    "name": f"Rule {int(time.time())}",
-                    "description": description,
-                    "action": action,
-                    "filter": {
-                        "expression": expression,
-                        "paused": False
-                    },
-                    "products": ["firewall"]
-                }
-                
-                # Send request
-                async with session.post(url, headers=self.headers, json=data) as response:
-                    result = await response.json()
-                    
-                    # Check if request was successful
-                    if result.get("success", False):
-                        logger.info(f"Successfully created firewall rule in Cloudflare")
-                        return True, result
-                    else:
-                        logger.error(f"Failed to create firewall rule in Cloudflare: {result.get('errors', [])}")
-                        return False, result
+            url = f"{self.base_url}/zones/{self.zone_id}/firewall/rules"
+            
+            # Prepare data
+            data = {
+                "name": f"Rule {int(time.time())}",
+                "description": description,
+                "action": action,
+                "filter": {
+                    "expression": expression,
+                    "paused": False
+                },
+                "products": ["firewall"]
+            }
+            
+            # Send request
+            _, result = await self._request("POST", url, json=data)
+            
+            # Check if request was successful
+            if result.get("success", False):
+                logger.info(f"Successfully created firewall rule in Cloudflare")
+                return True, result
+            else:
+                logger.error(f"Failed to create firewall rule in Cloudflare: {result.get('errors', [])}")
+                return False, result
         except Exception as e:
             logger.error(f"Error creating firewall rule in Cloudflare: {e}")
             return False, {"success": False, "message": str(e)}
@@ -438,7 +1303,7 @@ class CloudflareAPIClient:
         await self._check_rate_limit()
         
         try:
-            # Get all firewall rules
+            # Firewall rules and IP list items, merged by get_blocked_ips
             rules = await self.get_blocked_ips()
             
             # Extract IPs and reasons
@@ -451,6 +1316,8 @@ class CloudflareAPIClient:
                     blocked_ips[ip] = description
                     # Update cache
                     blocked_ips_cache.add(ip)
+                    if "OPTIONS" in description:
+                        self._options_banned.add(ip)
             
             return blocked_ips
         except Exception as e:
@@ -489,8 +1356,28 @@ class CloudflareAPIClient:
             
         return False, None
 
-# Initialize global client
-cf_client = CloudflareAPIClient() if CF_API_EMAIL and CF_API_KEY and CF_ZONE_ID else None
+# Global client, created on first use
+_cf_client: Optional[CloudflareAPIClient] = None
+_CF_CLIENT_LOCK = threading.Lock()
+
+def get_cf_client() -> Optional[CloudflareAPIClient]:
+    """
+    Get the global Cloudflare client, creating it on first use.
+    
+    Returns:
+        Optional[CloudflareAPIClient]: The client, or None if no credentials are
+        configured outside development mode
+    """
+    global _cf_client
+    
+    if _cf_client is not None or not (CF_DEV_MODE or (CF_API_EMAIL and CF_API_KEY and CF_ZONE_ID)):
+        return _cf_client
+        
+    with _CF_CLIENT_LOCK:
+        if _cf_client is None:
+            _cf_client = CloudflareAPIClient()
+            
+    return _cf_client
 
 # Integration with the existing ban system
 def integrate_with_ban_manager():
@@ -515,9 +1402,11 @@ def integrate_with_ban_manager():
             # جمع العناوين المحظورة في دفعة
             _blocked_ips_batch.append(ip)
             
-            # Then block on Cloudflare if enabled - without duplicate log
-            if CF_API_EMAIL and CF_API_KEY and CF_ZONE_ID and cf_client:
-                cf_client.block_ip(ip, reason, duration)
+            # Then block on Cloudflare if enabled - without duplicate log;
+            # the client sends queued blocks in bulk from the background loop
+            cf_client = get_cf_client()
+            if cf_client:
+                cf_client.queue_block(ip, reason, duration or 86400)
             
             # طباعة تقرير مجمع كل فترة زمنية 
             current_time = time.time()
@@ -532,8 +1421,9 @@ def integrate_with_ban_manager():
             result = original_unban_ip(ip)
             
             # Then unblock on Cloudflare if enabled
-            if CF_API_EMAIL and CF_API_KEY and CF_ZONE_ID and cf_client:
-                cf_client.unblock_ip(ip)
+            cf_client = get_cf_client()
+            if cf_client:
+                asyncio.run_coroutine_threadsafe(cf_client.unblock_ip(ip), get_background_loop())
                 
             return result
         
@@ -550,9 +1440,10 @@ def integrate_with_ban_manager():
         logger.error(f"Error integrating with ban manager: {e}")
         return False
 
-def sync_from_cloudflare():
+async def sync_from_cloudflare():
     """Sync blocked IPs from Cloudflare to the local ban system."""
-    if not CF_API_EMAIL or not CF_API_KEY or not CF_ZONE_ID or not cf_client:
+    cf_client = get_cf_client()
+    if not cf_client:
         logger.warning("Cloudflare integration not enabled, skipping sync")
         return False
         
@@ -563,19 +1454,24 @@ def sync_from_cloudflare():
         original_ban_ip = ban_manager.ban_ip
         
         # Get blocked IPs from Cloudflare
-        blocked_ips = cf_client.get_blocked_ips()
+        blocked_ips = await cf_client.get_blocked_ips()
         
         # Add each IP to the local ban system
-        count = 0
-        for ip_data in blocked_ips:
-            ip = ip_data.get("ip")
-            reason = ip_data.get("description", "Synced from Cloudflare")
-            
-            # Check if the IP is already banned locally
-            if not ban_manager.is_banned(ip):
-                # Call the original method to avoid recursion
-                original_ban_ip(ip, reason)
-                count += 1
+        def store_bans() -> int:
+            count = 0
+            for ip_data in blocked_ips:
+                ip = ip_data.get("ip")
+                reason = ip_data.get("description", "Synced from Cloudflare")
+                
+                # Check if the IP is already banned locally
+                if not ban_manager.is_banned(ip):
+                    # Call the original method to avoid recursion
+                    original_ban_ip(ip, reason)
+                    count += 1
+            return count
+        
+        # Storage calls block, so keep them off the event loop
+        count = await asyncio.get_running_loop().run_in_executor(None, store_bans)
         
         # طباعة رسالة واحدة تلخص عدد العناوين المحظورة
         if count > 0:
@@ -588,41 +1484,66 @@ def sync_from_cloudflare():
         logger.error(f"Error syncing from Cloudflare: {e}")
         return False
 
-# Schedule periodic sync
+# Schedule periodic sync; the lock makes the running check and flag update atomic
+_SYNC_LOCK = threading.Lock()
+_SYNC_FUTURE = None  # Running sync job on the background loop, kept so it can be cancelled
+
 def start_periodic_sync(interval=3600):
     """Start periodic sync from Cloudflare to local ban system.
     
     Args:
         interval: Sync interval in seconds (default: 1 hour)
     """
-    if not CF_API_EMAIL or not CF_API_KEY or not CF_ZONE_ID or not cf_client:
+    global _SYNC_FUTURE
+    
+    if not get_cf_client():
         logger.warning("Cloudflare integration not enabled, periodic sync not started")
         return False
     
     # منع تشغيل مهام متعددة - استخدام متغير ثابت
-    if hasattr(start_periodic_sync, '_is_running') and start_periodic_sync._is_running:
-        logger.info("Periodic sync already running, not starting another one")
-        return True
+    with _SYNC_LOCK:
+        if getattr(start_periodic_sync, '_is_running', False):
+            logger.info("Periodic sync already running, not starting another one")
+            return True
+            
+        # تعيين علامة لمنع تشغيل مهام متعددة
+        start_periodic_sync._is_running = True
     
     try:
-        import threading
-        
-        def sync_job():
+        async def sync_job():
             while True:
                 try:
                     # تنفيذ المزامنة بدون رسائل سجل متكررة
-                    sync_from_cloudflare()
+                    await sync_from_cloudflare()
                 except Exception as e:
                     logger.error(f"Error in periodic sync: {e}")
-                time.sleep(interval)
-        
-        # تعيين علامة لمنع تشغيل مهام متعددة
-        start_periodic_sync._is_running = True
+                await asyncio.sleep(interval)
         
-        sync_thread = threading.Thread(target=sync_job, daemon=True)
-        sync_thread.start()
+        # Run on the shared background loop, which also owns the pooled session
+        _SYNC_FUTURE = asyncio.run_coroutine_threadsafe(sync_job(), get_background_loop())
         logger.info(f"Started periodic sync from Cloudflare every {interval} seconds")
         return True
     except Exception as e:
         logger.error(f"Failed to start periodic sync: {e}")
-        return False 
\ No newline at end of file
+        start_periodic_sync._is_running = False
+        return False 
+
+def stop_periodic_sync():
+    """Cancel the periodic sync started by start_periodic_sync().
+    
+    Returns:
+        bool: True if a running sync was cancelled
+    """
+    global _SYNC_FUTURE
+    
+    with _SYNC_LOCK:
+        future, _SYNC_FUTURE = _SYNC_FUTURE, None
+        start_periodic_sync._is_running = False
+        
+    if future is None:
+        return False
+        
+    # Cancelling the future cancels the task, interrupting its asyncio.sleep()
+    future.cancel()
+    logger.info("Stopped periodic sync from Cloudflare")
+    return True
@@ -19,6 +19,8 @@ import json
 import logging
 import asyncio
 import time
+import hashlib
+import atexit
 from functools import wraps
 from typing import Dict, Any, Optional
 
@@ -30,15 +32,153 @@ try:
 except ImportError:
     FLASK_AVAILABLE = False
     
+# Optional faster JSON encoder/decoder for request and response bodies
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+    
+from ddos_protection.utils import is_valid_ip
+
+# Shared event loop that runs the client's coroutines
+try:
+    from .api import get_background_loop, get_cf_client
+except ImportError:
+    get_background_loop = None
+    get_cf_client = None
+    
 # Configure logger
 logger = logging.getLogger('ddos_protection.cloudflare.routes')
 
+# Seconds a route waits for a Cloudflare call to finish
+CF_CALL_TIMEOUT = 30
+
+# Cached response bodies: key -> (expires, body, etag)
+_cache: Dict[str, tuple] = {}
+STATUS_CACHE_TTL = 30
+IPS_CACHE_TTL = 10
+CACHE_CONTROL = 'private, max-age=5'
+
+# CORS headers added to responses from these routes, unless already set
+_CORS_HEADERS = (
+    ('Access-Control-Allow-Origin', '*'),
+    ('Access-Control-Allow-Headers', 'Content-Type,Authorization'),
+    ('Access-Control-Allow-Methods', 'GET,POST,PUT,DELETE,OPTIONS'),
+)
+
 # Reference to Cloudflare client
 cf_client = None
 
 # Check if we're in development mode
 CF_DEV_MODE = os.environ.get('CF_DEV_MODE', 'false').lower() == 'true'
 
+def _encode_json(payload):
+    """Encode a payload to JSON bytes, with orjson when available."""
+    return orjson.dumps(payload) if HAS_ORJSON else json.dumps(payload).encode('utf-8')
+
+# Constant error responses, encoded once: (body, status)
+_ERR_NOT_CONFIGURED = (_encode_json({"success": False, "error": "Cloudflare integration not configured"}), 503)
+_ERR_INVALID_JSON = (_encode_json({"success": False, "error": "Invalid JSON body"}), 400)
+_ERR_IP_REQUIRED = (_encode_json({"success": False, "error": "IP address required"}), 400)
+_ERR_INVALID_IP = (_encode_json({"success": False, "error": "Invalid IP address"}), 400)
+
+def _error(err):
+    """
+    Build a response from one of the pre-encoded error bodies.
+    
+    Args:
+        err: (body, status) tuple
+        
+    Returns:
+        Response: Flask response
+    """
+    body, status = err
+    return Response(body, status=status, mimetype='application/json')
+
+def _json(payload, status=200):
+    """
+    Build a JSON response, encoded with orjson when available.
+    
+    Args:
+        payload: Data to encode
+        status: HTTP status code
+        
+    Returns:
+        Response: Flask response
+    """
+    if HAS_ORJSON:
+        return Response(orjson.dumps(payload), status=status, mimetype='application/json')
+    return jsonify(payload), status
+
+def _request_json():
+    """
+    Parse the request body as a JSON object, with orjson when available.
+    
+    Returns:
+        Optional[Dict]: Parsed body, or None if it is not a JSON object
+    """
+    body = request.get_data(cache=False) or b'{}'
+    try:
+        data = orjson.loads(body) if HAS_ORJSON else json.loads(body)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+def _cached_json(key, ttl, builder):
+    """
+    Serve a JSON payload from the response cache, rebuilding it after `ttl` seconds.
+    
+    The response carries a weak ETag and a short private Cache-Control, and a
+    request whose If-None-Match matches the ETag gets an empty 304 instead of
+    the body.
+    
+    Args:
+        key: Cache key
+        ttl: Seconds the payload stays cached
+        builder: Callable returning the payload
+        
+    Returns:
+        Response: Flask response
+    """
+    now = time.monotonic()
+    entry = _cache.get(key)
+    if entry is None or entry[0] <= now:
+        payload = builder()
+        body = _encode_json(payload)
+        entry = (now + ttl, body, hashlib.blake2b(body, digest_size=8).hexdigest())
+        _cache[key] = entry
+        
+    _, body, etag = entry
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    return response
+
+def _run(coro, timeout=CF_CALL_TIMEOUT):
+    """
+    Run a coroutine on the shared background loop and wait for its result.
+    
+    Args:
+        coro: Coroutine to run
+        timeout: Seconds to wait before giving up
+        
+    Returns:
+        The coroutine's result
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, get_background_loop())
+    return future.result(timeout)
+
+def _close_client(client):
+    """Close a client's pooled HTTP session on the background loop at exit."""
+    try:
+        _run(client.close(), timeout=5)
+    except Exception as e:
+        logger.debug("Error closing Cloudflare session: %s", e)
+
 def register_cloudflare_routes(app):
     """
     Register Cloudflare routes with Flask app.
@@ -56,6 +196,9 @@ def register_cloudflare_routes(app):
     # Get Cloudflare client
     global cf_client
     cf_client = app.cf_client if hasattr(app, 'cf_client') else None
+    if cf_client is None and get_cf_client is not None:
+        # Share the package-wide client rather than creating another one
+        cf_client = get_cf_client()
     
     # Solo mostrar advertencia si no estamos en modo de desarrollo
     if not cf_client and not CF_DEV_MODE:
@@ -63,204 +206,186 @@ def register_cloudflare_routes(app):
     elif CF_DEV_MODE:
         logger.info("Cloudflare routes registered in DEVELOPMENT mode (simulated responses)")
         
-        # En modo desarrollo, crear un cliente simulado si no existe
-        from ddos_protection.network.cloudflare.api import CloudflareAPIClient
-        cf_client = CloudflareAPIClient()
+    # Routes share the client's pooled session on the background loop; start
+    # the loop now so the session is closed before the loop stops at exit
+    if cf_client is not None and get_background_loop is not None:
+        get_background_loop()
+        atexit.register(_close_client, cf_client)
     
-    # Define routes
-    @cf_blueprint.route('/api/cloudflare/ips', methods=['GET', 'OPTIONS'])
-    @cf_blueprint.route('/api/ddos/cloudflare/ips', methods=['GET', 'OPTIONS'])
+    # Check if Cloudflare API credentials are configured; the environment
+    # is read once here since the status only changes on restart
+    cf_api_email = os.environ.get('CF_API_EMAIL', '')
+    cf_api_key = os.environ.get('CF_API_KEY', '')
+    cf_zone_id = os.environ.get('CF_ZONE_ID', '')
+    
+    status_payload = {
+        "success": True,
+        "status": {
+            "configured": all([cf_api_email, cf_api_key, cf_zone_id]),
+            "client_available": cf_client is not None,
+            "using_exclusively": os.environ.get('USE_CLOUDFLARE_EXCLUSIVELY', 'false').lower() == 'true',
+            "api_email_set": bool(cf_api_email),
+            "api_key_set": bool(cf_api_key),
+            "zone_id_set": bool(cf_zone_id)
+        }
+    }
+    
+    # Resolved here rather than at module import: this module is imported
+    # while the cloudflare package is still initializing
+    from ddos_protection.network.cloudflare import sync_from_cloudflare as do_sync
+    
+    # Define route views
     def get_blocked_ips():
         """Get all blocked IPs from Cloudflare."""
-        # Handle OPTIONS request for CORS
-        if request.method == 'OPTIONS':
-            return _handle_cors_preflight()
-            
         if not cf_client:
-            return jsonify({"success": False, "error": "Cloudflare integration not configured"}), 503
+            return _error(_ERR_NOT_CONFIGURED)
         
         try:
-            # Run async function in a sync context
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                blocked_ips = loop.run_until_complete(cf_client.get_blocked_ips())
-            finally:
-                loop.close()
+            def build():
+                # Run on the shared loop so the client's session is reused
+                blocked_ips = _run(cf_client.get_blocked_ips())
+                return {
+                    "success": True,
+                    "blocked_ips": blocked_ips
+                }
                 
-            return jsonify({
-                "success": True,
-                "blocked_ips": blocked_ips
-            })
+            return _cached_json('ips', IPS_CACHE_TTL, build)
         except Exception as e:
-            logger.error(f"Error getting blocked IPs: {e}")
-            return jsonify({
+            logger.exception("Error getting blocked IPs: %s", e)
+            return _json({
                 "success": False,
                 "error": str(e)
-            }), 500
+            }, 500)
     
-    @cf_blueprint.route('/api/cloudflare/block', methods=['POST', 'OPTIONS'])
-    @cf_blueprint.route('/api/ddos/cloudflare/block', methods=['POST', 'OPTIONS'])
     def block_ip():
         """Block an IP address in Cloudflare."""
-        # Handle OPTIONS request for CORS
-        if request.method == 'OPTIONS':
-            return _handle_cors_preflight()
-            
         if not cf_client:
-            return jsonify({"success": False, "error": "Cloudflare integration not configured"}), 503
+            return _error(_ERR_NOT_CONFIGURED)
         
         try:
-            data = request.get_json()
+            data = _request_json()
+            if data is None:
+                return _error(_ERR_INVALID_JSON)
             ip = data.get('ip')
             reason = data.get('reason', 'Blocked via API')
             duration = data.get('duration', 86400)  # Default: 24 hours
             
             if not ip:
-                return jsonify({"success": False, "error": "IP address required"}), 400
+                return _error(_ERR_IP_REQUIRED)
+            if not isinstance(ip, str) or not is_valid_ip(ip):
+                return _error(_ERR_INVALID_IP)
                 
-            # Run async function in a sync context
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                success, result = loop.run_until_complete(cf_client.block_ip(ip, reason, duration))
-            finally:
-                loop.close()
+            # Run on the shared loop so the client's session is reused
+            success, result = _run(cf_client.block_ip(ip, reason, duration))
                 
             if success:
-                return jsonify({
+                _cache.pop('ips', None)
+                return _json({
                     "success": True,
                     "message": f"IP {ip} blocked successfully"
                 })
             else:
-                return jsonify({
+                return _json({
                     "success": False,
                     "error": f"Failed to block IP: {result.get('message', 'Unknown error')}"
-                }), 500
+                }, 500)
         except Exception as e:
-            logger.error(f"Error blocking IP: {e}")
-            return jsonify({
+            logger.exception("Error blocking IP: %s", e)
+            return _json({
                 "success": False,
                 "error": str(e)
-            }), 500
+            }, 500)
     
-    @cf_blueprint.route('/api/cloudflare/unblock', methods=['POST', 'OPTIONS'])
-    @cf_blueprint.route('/api/ddos/cloudflare/unblock', methods=['POST', 'OPTIONS'])
     def unblock_ip():
         """Unblock an IP address in Cloudflare."""
-        # Handle OPTIONS request for CORS
-        if request.method == 'OPTIONS':
-            return _handle_cors_preflight()
-            
         if not cf_client:
-            return jsonify({"success": False, "error": "Cloudflare integration not configured"}), 503
+            return _error(_ERR_NOT_CONFIGURED)
         
         try:
-            data = request.get_json()
+            data = _request_json()
+            if data is None:
+                return _error(_ERR_INVALID_JSON)
             ip = data.get('ip')
             
             if not ip:
-                return jsonify({"success": False, "error": "IP address required"}), 400
+                return _error(_ERR_IP_REQUIRED)
+            if not isinstance(ip, str) or not is_valid_ip(ip):
+                return _error(_ERR_INVALID_IP)
                 
-            # Run async function in a sync context
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                success, result = loop.run_until_complete(cf_client.unblock_ip(ip))
-            finally:
-                loop.close()
+            # Run on the shared loop so the client's session is reused
+            success, result = _run(cf_client.unblock_ip(ip))
                 
             if success:
-                return jsonify({
+                _cache.pop('ips', None)
+                return _json({
                     "success": True,
                     "message": f"IP {ip} unblocked successfully"
                 })
             else:
-                return jsonify({
+                return _json({
                     "success": False,
                     "error": f"Failed to unblock IP: {result.get('message', 'Unknown error')}"
-                }), 500
+                }, 500)
         except Exception as e:
-            logger.error(f"Error unblocking IP: {e}")
-            return jsonify({
+            logger.exception("Error unblocking IP: %s", e)
+            return _json({
                 "success": False,
                 "error": str(e)
-            }), 500
+            }, 500)
     
-    @cf_blueprint.route('/api/cloudflare/status', methods=['GET', 'OPTIONS'])
-    @cf_blueprint.route('/api/ddos/cloudflare/status', methods=['GET', 'OPTIONS'])
     def get_status():
         """Get Cloudflare integration status."""
-        # Handle OPTIONS request for CORS
-        if request.method == 'OPTIONS':
-            return _handle_cors_preflight()
-            
-        # Check if Cloudflare API credentials are configured
-        cf_api_email = os.environ.get('CF_API_EMAIL', '')
-        cf_api_key = os.environ.get('CF_API_KEY', '')
-        cf_zone_id = os.environ.get('CF_ZONE_ID', '')
-        
-        is_configured = all([cf_api_email, cf_api_key, cf_zone_id])
-        is_client_available = cf_client is not None
-        using_exclusively = os.environ.get('USE_CLOUDFLARE_EXCLUSIVELY', 'false').lower() == 'true'
-        
-        return jsonify({
-            "success": True,
-            "status": {
-                "configured": is_configured,
-                "client_available": is_client_available,
-                "using_exclusively": using_exclusively,
-                "api_email_set": bool(cf_api_email),
-                "api_key_set": bool(cf_api_key),
-                "zone_id_set": bool(cf_zone_id)
-            }
-        })
+        return _cached_json('status', STATUS_CACHE_TTL, lambda: status_payload)
     
-    @cf_blueprint.route('/api/cloudflare/sync', methods=['POST', 'OPTIONS'])
-    @cf_blueprint.route('/api/ddos/cloudflare/sync', methods=['POST', 'OPTIONS'])
     def sync_from_cloudflare():
         """Sync blocked IPs from Cloudflare to local system."""
-        # Handle OPTIONS request for CORS
-        if request.method == 'OPTIONS':
-            return _handle_cors_preflight()
-            
         if not cf_client:
-            return jsonify({"success": False, "error": "Cloudflare integration not configured"}), 503
+            return _error(_ERR_NOT_CONFIGURED)
             
         try:
-            # Run async function in a sync context
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                # Import sync_from_cloudflare function
-                from ddos_protection.network.cloudflare import sync_from_cloudflare as do_sync
-                success = loop.run_until_complete(do_sync())
-            finally:
-                loop.close()
+            # Run on the shared loop so the client's session is reused
+            success = _run(do_sync())
                 
             if success:
-                return jsonify({
+                _cache.pop('ips', None)
+                return _json({
                     "success": True,
                     "message": "Successfully synced blocked IPs from Cloudflare"
                 })
             else:
-                return jsonify({
+                return _json({
                     "success": False,
                     "error": "Failed to sync blocked IPs from Cloudflare"
-                }), 500
+                }, 500)
         except Exception as e:
-            logger.error(f"Error syncing from Cloudflare: {e}")
-            return jsonify({
+            logger.exception("Error syncing from Cloudflare: %s", e)
+            return _json({
                 "success": False,
                 "error": str(e)
-            }), 500
+            }, 500)
             
+    # Every endpoint is served under both the canonical and the /api/ddos/ prefix
+    for name, view, methods in (
+        ('ips', get_blocked_ips, ['GET', 'OPTIONS']),
+        ('block', block_ip, ['POST', 'OPTIONS']),
+        ('unblock', unblock_ip, ['POST', 'OPTIONS']),
+        ('status', get_status, ['GET', 'OPTIONS']),
+        ('sync', sync_from_cloudflare, ['POST', 'OPTIONS']),
+    ):
+        for prefix in ('/api/cloudflare/', '/api/ddos/cloudflare/'):
+            cf_blueprint.add_url_rule(prefix + name, view_func=view, methods=methods)
+            
+    @cf_blueprint.before_request
     def _handle_cors_preflight():
-        """Handle CORS preflight OPTIONS request."""
-        response = Response()
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-        response.headers.add('Access-Control-Allow-Methods', 'GET,POST,PUT,DELETE,OPTIONS')
+        """Answer CORS preflight OPTIONS requests before they reach a route."""
+        if request.method == 'OPTIONS':
+            return '', 204
+    
+    @cf_blueprint.after_request
+    def _add_cors_headers(response):
+        """Add any CORS headers the response does not already carry."""
+        for name, value in _CORS_HEADERS:
+            response.headers.setdefault(name, value)
         return response
     
     # Register blueprint with app
@@ -16,24 +16,48 @@ logger = logging.getLogger('ddos_protection.network.system_firewall')
 class SystemFirewall:
     """Stub class for system firewall to avoid import errors."""
     
+    __slots__ = ()
+    
     def __init__(self):
         """Initialize system firewall stub."""
         logger.info("SystemFirewall stub initialized (Cloudflare-only mode)")
         
-    def block_ip(self, ip, reason="Unknown", duration=None):
+    @staticmethod
+    def block_ip(ip, reason="Unknown", duration=None):
         """Stub method for blocking IP."""
-        logger.debug(f"SystemFirewall stub: block_ip called for {ip} (ignored in Cloudflare-only mode)")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("SystemFirewall stub: block_ip called for %s (ignored in Cloudflare-only mode)", ip)
         return True
         
-    def unblock_ip(self, ip):
+    @staticmethod
+    def unblock_ip(ip):
         """Stub method for unblocking IP."""
-        logger.debug(f"SystemFirewall stub: unblock_ip called for {ip} (ignored in Cloudflare-only mode)")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("SystemFirewall stub: unblock_ip called for %s (ignored in Cloudflare-only mode)", ip)
         return True
         
-    def is_blocked(self, ip):
+    @staticmethod
+    def is_blocked(ip):
         """Stub method for checking if IP is blocked."""
         return False
         
-    def list_blocked(self):
+    @staticmethod
+    def list_blocked():
         """Stub method for listing blocked IPs."""
-        return [] 
\ No newline at end of file
+        return []
+
+
+# Shared instance; the stub has no state, so one is enough
+_SINGLETON = None
+
+def get_system_firewall():
+    """
+    Get the shared SystemFirewall stub, creating it on first use.
+    
+    Returns:
+        SystemFirewall: Stub instance
+    """
+    global _SINGLETON
+    if _SINGLETON is None:
+        _SINGLETON = SystemFirewall()
+    return _SINGLETON
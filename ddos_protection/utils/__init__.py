@@ -3,15 +3,6 @@ DDoS Protection System - Utilities
 أدوات مساعدة لنظام حماية DDoS
 """
 
-from .utils import (
-    is_valid_ip, is_ip_in_network, is_private_ip, is_known_good_bot,
-    calculate_entropy, get_ip_geolocation, execute_command, 
-    get_server_resources, generate_challenge, verify_challenge_response,
-    analyze_path_distribution, load_geolocation_db, extract_request_features,
-    get_client_ip_from_request, get_real_ip_from_request, get_ip_info_from_api,
-    is_ip_in_any_network
-)
-
 __all__ = [
     'is_valid_ip', 
     'is_ip_in_network', 
@@ -29,5 +20,15 @@ __all__ = [
     'get_client_ip_from_request',
     'get_real_ip_from_request',
     'get_ip_info_from_api',
-    'is_ip_in_any_network'
-] 
\ No newline at end of file
+    'is_ip_in_any_network',
+    'ip_to_int'
+]
+
+def __getattr__(name):
+    """Import the helpers from .utils on first access (PEP 562)."""
+    if name in __all__:
+        from . import utils as _utils
+        value = getattr(_utils, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -19,14 +19,20 @@ import re
 import math
 import time
 import random
+import atexit
 import logging
+import threading
 import socket
 import hashlib
+import hmac
+import struct
 import ipaddress
 import subprocess
+import shutil
 import statistics
-from typing import Dict, List, Tuple, Set, Any, Optional, Union
-from collections import Counter
+from typing import Dict, List, Tuple, Set, Any, Optional, Union, Callable
+from collections import Counter, OrderedDict
+from functools import lru_cache
 import json
 import urllib.parse
 import base64
@@ -51,6 +57,12 @@ except ImportError:
     NUMPY_AVAILABLE = False
     logger.warning("numpy not available, using fallback methods for calculations")
 
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = NUMPY_AVAILABLE
+except ImportError:
+    NUMBA_AVAILABLE = False
+
 try:
     import maxminddb
     MAXMIND_AVAILABLE = True
@@ -69,13 +81,73 @@ def is_valid_ip(ip: str) -> bool:
     Returns:
         bool: True if valid IP address
     """
+    # Only strings reach the cache; anything else (even unhashable) is invalid
+    return isinstance(ip, str) and _is_valid_ip_str(ip)
+
+
+@lru_cache(maxsize=4096)
+def _is_valid_ip_str(ip: str) -> bool:
+    """Validate an IP string; inet_pton is a single C call and results are cached."""
     try:
-        ipaddress.ip_address(ip)
+        socket.inet_pton(socket.AF_INET6 if ':' in ip else socket.AF_INET, ip)
         return True
-    except ValueError:
+    except (OSError, ValueError):
         return False
 
 
+def ip_to_int(ip: str) -> Optional[int]:
+    """
+    Convert an IP address to a fixed-width integer key.
+    
+    Equivalent spellings of the same address (e.g. "::1" and "0:0::1") map
+    to the same key. IPv6 keys have bit 128 set so they never collide with
+    IPv4 keys.
+    
+    Args:
+        ip: IP address to convert
+        
+    Returns:
+        Optional[int]: Integer key, or None if the IP address is invalid
+    """
+    # Only strings reach the cache; anything else (even unhashable) is invalid
+    return _ip_str_to_int(ip) if isinstance(ip, str) else None
+
+
+@lru_cache(maxsize=4096)
+def _ip_str_to_int(ip: str) -> Optional[int]:
+    """Convert an IP string to its integer key; results are cached."""
+    try:
+        if ':' in ip:
+            return int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), 'big') | (1 << 128)
+        return int.from_bytes(socket.inet_pton(socket.AF_INET, ip), 'big')
+    except (OSError, ValueError):
+        return None
+
+
+@lru_cache(maxsize=4096)
+def _parse_ip(ip: str) -> Union[ipaddress.IPv4Address, ipaddress.IPv6Address]:
+    """Parse an IP address; results are cached for repeat visitors."""
+    return ipaddress.ip_address(ip)
+
+
+@lru_cache(maxsize=512)
+def _parse_network(network: str) -> Union[ipaddress.IPv4Network, ipaddress.IPv6Network]:
+    """Parse a network in CIDR notation; results are cached."""
+    return ipaddress.ip_network(network, strict=False)
+
+
+@lru_cache(maxsize=128)
+def _compile_networks(networks: Tuple[str, ...]) -> Tuple[Union[ipaddress.IPv4Network, ipaddress.IPv6Network], ...]:
+    """Parse a list of CIDR networks once, skipping invalid entries."""
+    compiled = []
+    for network in networks:
+        try:
+            compiled.append(_parse_network(network))
+        except (ValueError, TypeError):
+            continue
+    return tuple(compiled)
+
+
 def is_ip_in_network(ip: str, network: str) -> bool:
     """
     Check if an IP address is in a specific network range.
@@ -88,25 +160,27 @@ def is_ip_in_network(ip: str, network: str) -> bool:
         bool: True if IP is in the network, False otherwise
     """
     try:
-        ip_obj = ipaddress.ip_address(ip)
-        network_obj = ipaddress.ip_network(network, strict=False)
-        return ip_obj in network_obj
-    except ValueError:
+        return _parse_ip(ip) in _parse_network(network)
+    except (ValueError, TypeError):
         return False
 
 
-def is_ip_in_any_network(ip: str, networks: List[str]) -> bool:
+def is_ip_in_any_network(ip: str, networks: Union[List[str], Tuple[str, ...]]) -> bool:
     """
     Check if an IP address is in any of the specified networks.
     
     Args:
         ip: IP address to check
-        networks: List of networks in CIDR notation
+        networks: List or tuple of networks in CIDR notation
         
     Returns:
         bool: True if IP is in any network, False otherwise
     """
-    return any(is_ip_in_network(ip, network) for network in networks)
+    try:
+        ip_obj = _parse_ip(ip)
+    except (ValueError, TypeError):
+        return False
+    return any(ip_obj in network for network in _compile_networks(tuple(networks)))
 
 
 def is_private_ip(ip: str) -> bool:
@@ -120,11 +194,30 @@ def is_private_ip(ip: str) -> bool:
         bool: True if private IP address
     """
     try:
-        return ipaddress.ip_address(ip).is_private
-    except ValueError:
+        return _parse_ip(ip).is_private
+    except (ValueError, TypeError):
         return False
 
 
+# Known good bots, matched as one case-insensitive alternation
+_GOOD_BOT_RE = re.compile(
+    r"Googlebot"
+    r"|Bingbot"
+    r"|Slurp"  # Yahoo
+    r"|DuckDuckBot"
+    r"|Baiduspider"
+    r"|YandexBot"
+    r"|facebookexternalhit"
+    r"|Twitterbot"
+    r"|Applebot"
+    r"|GoogleProber"
+    r"|PingdomTMS"
+    r"|UptimeRobot"
+    r"|StatusCake",
+    re.IGNORECASE
+)
+
+
 def is_known_good_bot(user_agent: str) -> bool:
     """
     Check if a user agent belongs to a known good bot.
@@ -135,28 +228,25 @@ def is_known_good_bot(user_agent: str) -> bool:
     Returns:
         bool: True if user agent is a known good bot, False otherwise
     """
-    # List of patterns for known good bots
-    good_bot_patterns = [
-        r"Googlebot", 
-        r"Bingbot",
-        r"Slurp",  # Yahoo
-        r"DuckDuckBot",
-        r"Baiduspider",
-        r"YandexBot",
-        r"facebookexternalhit",
-        r"Twitterbot",
-        r"Applebot",
-        r"GoogleProber",
-        r"PingdomTMS",
-        r"UptimeRobot",
-        r"StatusCake"
-    ]
-    
     # Check if user agent matches any known good bot pattern
-    if user_agent:
-        return any(re.search(pattern, user_agent, re.IGNORECASE) for pattern in good_bot_patterns)
-    
-    return False
+    return bool(user_agent and _GOOD_BOT_RE.search(user_agent))
+
+
+# Below this many values the numpy path beats the JIT call overhead
+NUMBA_MIN_VALUES = 64
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, fastmath=True)
+    def _entropy_kernel(counts):
+        """Shannon entropy of a float64 array of counts with a positive total."""
+        inv_total = 1.0 / counts.sum()
+        entropy = 0.0
+        for i in range(counts.size):
+            count = counts[i]
+            if count > 0:
+                p = count * inv_total
+                entropy -= p * math.log2(p)
+        return entropy
 
 
 def calculate_entropy(values: List[int]) -> float:
@@ -165,23 +255,30 @@ def calculate_entropy(values: List[int]) -> float:
     Lower entropy indicates more predictable patterns.
     
     Args:
-        values: List of frequency values
+        values: List (or numpy array) of frequency values
         
     Returns:
         float: Entropy value
     """
-    if not values or sum(values) == 0:
-        return 0.0
-        
-    # Calculate probabilities
-    total = sum(values)
-    probabilities = [count / total for count in values if count > 0]
-    
-    # Calculate entropy using Shannon formula
+    # Calculate entropy using Shannon formula in one vectorized pass
     if NUMPY_AVAILABLE:
-        return -np.sum(probabilities * np.log2(probabilities))
-    else:
-        return -sum(p * math.log2(p) for p in probabilities)
+        counts = np.asarray(values, dtype=np.float64)
+        total = counts.sum()
+        if total == 0:
+            return 0.0
+        if NUMBA_AVAILABLE and counts.size >= NUMBA_MIN_VALUES:
+            return float(_entropy_kernel(counts))
+        probabilities = counts[counts > 0] / total
+        return float(-(probabilities * np.log2(probabilities)).sum())
+        
+    total = sum(values) if values else 0
+    if total == 0:
+        return 0.0
+    return -sum(count / total * math.log2(count / total) for count in values if count > 0)
+
+
+# Extensions counted as static assets by analyze_path_distribution
+_STATIC_EXTENSIONS = ('.js', '.css', '.jpg', '.jpeg', '.png', '.gif', '.ico', '.svg', '.woff', '.woff2')
 
 
 def analyze_path_distribution(paths: List[str]) -> Dict[str, float]:
@@ -209,17 +306,23 @@ def analyze_path_distribution(paths: List[str]) -> Dict[str, float]:
     unique_count = len(path_counter)
     unique_ratio = unique_count / len(paths)
     
+    # Per-path counts, shared by the most-common ratio and the entropy
+    if NUMPY_AVAILABLE:
+        counts = np.fromiter(path_counter.values(), dtype=np.int64, count=unique_count)
+        most_common = int(counts.max())
+    else:
+        counts = list(path_counter.values())
+        most_common = max(counts)
+    
     # Most common path ratio
-    most_common = path_counter.most_common(1)
-    most_common_ratio = most_common[0][1] / len(paths) if most_common else 0
+    most_common_ratio = most_common / len(paths)
     
-    # Static vs. dynamic path ratio
-    static_extensions = ['.js', '.css', '.jpg', '.jpeg', '.png', '.gif', '.ico', '.svg', '.woff', '.woff2']
-    static_paths = sum(path_counter[p] for p in path_counter if any(p.endswith(ext) for ext in static_extensions))
+    # Static vs. dynamic path ratio (endswith checks the whole tuple in C)
+    static_paths = sum(count for p, count in path_counter.items() if p.endswith(_STATIC_EXTENSIONS))
     static_ratio = static_paths / len(paths)
     
     # Entropy of path distribution
-    entropy = calculate_entropy(list(path_counter.values()))
+    entropy = calculate_entropy(counts)
     
     return {
         "entropy": entropy,
@@ -229,6 +332,12 @@ def analyze_path_distribution(paths: List[str]) -> Dict[str, float]:
     }
 
 
+# Lowercase user agent substrings used by extract_request_features
+_MOBILE_TOKENS = ('mobile', 'android')
+_BOT_TOKENS = ('bot', 'spider')
+_PLATFORM_TOKENS = ('windows', 'mac', 'linux', 'android', 'ios')
+
+
 def extract_request_features(
     path: str, 
     method: str, 
@@ -249,6 +358,10 @@ def extract_request_features(
     Returns:
         Dict[str, Any]: Extracted request features
     """
+    # Lowercase header names once so each lookup below is a single probe
+    hl = {k.lower(): v for k, v in headers.items()}
+    content_type = hl.get("content-type", "")
+    
     features = {
         "path_length": len(path),
         "path_depth": path.count('/'),
@@ -256,24 +369,25 @@ def extract_request_features(
         "has_query": bool(query),
         "query_param_count": len(query),
         "body_size": body_size,
-        "has_user_agent": "user-agent" in headers or "User-Agent" in headers,
-        "has_referer": "referer" in headers or "Referer" in headers,
-        "has_cookies": "cookie" in headers or "Cookie" in headers,
+        "has_user_agent": "user-agent" in hl,
+        "has_referer": "referer" in hl,
+        "has_cookies": "cookie" in hl,
         "header_count": len(headers),
-        "is_ajax": headers.get("X-Requested-With") == "XMLHttpRequest",
-        "is_json": headers.get("Content-Type", "").startswith("application/json"),
-        "is_form": headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"),
-        "is_multipart": headers.get("Content-Type", "").startswith("multipart/form-data"),
+        "is_ajax": hl.get("x-requested-with") == "XMLHttpRequest",
+        "is_json": content_type.startswith("application/json"),
+        "is_form": content_type.startswith("application/x-www-form-urlencoded"),
+        "is_multipart": content_type.startswith("multipart/form-data"),
     }
     
     # Extract user agent features if present
-    ua = headers.get("user-agent") or headers.get("User-Agent", "")
+    ua = hl.get("user-agent", "")
     if ua:
+        ua_lower = ua.lower()
         features.update({
             "ua_length": len(ua),
-            "ua_is_mobile": "mobile" in ua.lower() or "android" in ua.lower(),
-            "ua_is_bot": is_known_good_bot(ua) or "bot" in ua.lower() or "spider" in ua.lower(),
-            "ua_has_platform": any(platform in ua.lower() for platform in ["windows", "mac", "linux", "android", "ios"]),
+            "ua_is_mobile": any(token in ua_lower for token in _MOBILE_TOKENS),
+            "ua_is_bot": any(token in ua_lower for token in _BOT_TOKENS) or is_known_good_bot(ua),
+            "ua_has_platform": any(token in ua_lower for token in _PLATFORM_TOKENS),
         })
     else:
         features.update({
@@ -286,10 +400,58 @@ def extract_request_features(
     return features
 
 
+# Shared MaxMind reader and IPinfo HTTP session, created on first use
+_GEO_READER: Optional[Any] = None
+_GEO_PATH: Optional[str] = None
+_SESSION: Optional[Any] = None
+_SHARED_LOCK = threading.Lock()
+
+
+def _close_shared_resources() -> None:
+    """Close the shared MaxMind reader and HTTP session at interpreter exit."""
+    global _GEO_READER, _GEO_PATH, _SESSION
+    
+    with _SHARED_LOCK:
+        for resource in (_GEO_READER, _SESSION):
+            if resource is not None:
+                try:
+                    resource.close()
+                except Exception as e:
+                    logger.debug(f"Error closing shared resource: {e}")
+        _GEO_READER = _GEO_PATH = _SESSION = None
+
+
+atexit.register(_close_shared_resources)
+
+
+def _get_session() -> Any:
+    """
+    Get the shared requests session for IPinfo lookups.
+    
+    Returns:
+        requests.Session: Pooled session that keeps TCP/TLS connections alive
+    """
+    global _SESSION
+    
+    if _SESSION is None:
+        with _SHARED_LOCK:
+            if _SESSION is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                
+                session = requests.Session()
+                session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=16))
+                _SESSION = session
+    return _SESSION
+
+
 def load_geolocation_db(db_path: str) -> Optional[Any]:
     """
     Load MaxMind GeoLite2 database for IP geolocation.
     
+    The reader is shared: repeat calls with the same path return the
+    already-open database instead of mapping the file again.
+    
     Args:
         db_path: Path to MaxMind GeoLite2 database file
         
@@ -300,12 +462,22 @@ def load_geolocation_db(db_path: str) -> Optional[Any]:
         logger.warning("Geolocation database loading failed: maxminddb not installed")
         return None
     
+    global _GEO_READER, _GEO_PATH
+    
     try:
-        if os.path.exists(db_path):
-            return maxminddb.open_database(db_path)
-        else:
-            logger.warning(f"Geolocation database not found at {db_path}")
-            return None
+        with _SHARED_LOCK:
+            if _GEO_READER is not None and _GEO_PATH == db_path:
+                return _GEO_READER
+            
+            if os.path.exists(db_path):
+                # A new path replaces the shared reader; the old one is left
+                # open for anyone still holding it and closes when collected
+                _GEO_READER = maxminddb.open_database(db_path)
+                _GEO_PATH = db_path
+                return _GEO_READER
+            else:
+                logger.warning(f"Geolocation database not found at {db_path}")
+                return None
     except Exception as e:
         logger.error(f"Error loading geolocation database: {e}")
         return None
@@ -331,7 +503,7 @@ def get_ip_info_from_api(ip: str, token: str = None) -> Optional[Dict[str, Any]]
         return {"country_code": "PRIVATE", "country": "Private IP"}
         
     try:
-        import requests
+        session = _get_session()
         
         # Construct the API URL
         api_url = f"https://api.ipinfo.io/lite/{ip}"
@@ -343,7 +515,7 @@ def get_ip_info_from_api(ip: str, token: str = None) -> Optional[Dict[str, Any]]
             params["token"] = token
         
         # Send request with timeout
-        response = requests.get(api_url, headers=headers, params=params, timeout=2)
+        response = session.get(api_url, headers=headers, params=params, timeout=2)
         
         if response.status_code == 200:
             data = response.json()
@@ -358,10 +530,26 @@ def get_ip_info_from_api(ip: str, token: str = None) -> Optional[Dict[str, Any]]
         return None
 
 
+# Successful geolocation results are cached per IP for about GEO_CACHE_TTL
+# seconds; each entry's lifetime is jittered by +/- GEO_CACHE_JITTER so cached
+# IPs don't all expire (and hit the database or API) at the same moment
+GEO_CACHE_TTL = 300
+GEO_CACHE_JITTER = 0.1
+GEO_CACHE_SIZE = 65536
+
+# (ip, geo_db, api_token) -> (expiry, result), in least-recently-used order
+_geo_cache: "OrderedDict[Tuple[str, Any, Optional[str]], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_geo_cache_lock = threading.Lock()
+
+
 def get_ip_geolocation(ip: str, geo_db: Any = None, api_token: str = None) -> Optional[Dict[str, Any]]:
     """
     Get geolocation information for an IP address.
     
+    Successful results are cached, so repeat lookups for the same IP within
+    about GEO_CACHE_TTL seconds skip the database and the API. Failed
+    lookups are not cached and are retried on the next call.
+    
     Args:
         ip: IP address to look up
         geo_db: MaxMind GeoLite2 database reader
@@ -370,6 +558,35 @@ def get_ip_geolocation(ip: str, geo_db: Any = None, api_token: str = None) -> Op
     Returns:
         Dict with geolocation information or None if lookup failed
     """
+    key = (ip, geo_db, api_token)
+    now = time.monotonic()
+    
+    with _geo_cache_lock:
+        entry = _geo_cache.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                _geo_cache.move_to_end(key)
+                # Hand out a copy so callers cannot mutate the cached entry
+                return dict(entry[1])
+            del _geo_cache[key]
+    
+    result = _geo_lookup(ip, geo_db, api_token)
+    if result is None:
+        # Don't pin transient database or API failures
+        return None
+    
+    ttl = GEO_CACHE_TTL * random.uniform(1 - GEO_CACHE_JITTER, 1 + GEO_CACHE_JITTER)
+    with _geo_cache_lock:
+        _geo_cache[key] = (now + ttl, result)
+        _geo_cache.move_to_end(key)
+        if len(_geo_cache) > GEO_CACHE_SIZE:
+            _geo_cache.popitem(last=False)
+    
+    return dict(result)
+
+
+def _geo_lookup(ip: str, geo_db: Any, api_token: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Uncached geolocation lookup behind get_ip_geolocation."""
     # First try local database if available
     if geo_db:
         try:
@@ -414,6 +631,161 @@ def get_ip_geolocation(ip: str, geo_db: Any = None, api_token: str = None) -> Op
     return None
 
 
+# Previous /proc samples, used to turn cumulative counters into rates
+_last_cpu_sample: Optional[Tuple[int, int]] = None
+_last_net_sample: Optional[Tuple[float, int]] = None
+
+
+def _read_proc_stat() -> float:
+    """
+    Read CPU usage from /proc/stat.
+    
+    Returns:
+        float: CPU usage (%) since the previous call (since boot on the first call)
+    """
+    global _last_cpu_sample
+    
+    with open('/proc/stat') as f:
+        fields = f.readline().split()[1:]
+    times = [int(value) for value in fields]
+    # idle + iowait count as idle time
+    idle = times[3] + (times[4] if len(times) > 4 else 0)
+    total = sum(times)
+    
+    prev_idle, prev_total = _last_cpu_sample or (0, 0)
+    _last_cpu_sample = (idle, total)
+    
+    delta_total = total - prev_total
+    if delta_total <= 0:
+        return 0.0
+    return 100.0 * (1.0 - (idle - prev_idle) / delta_total)
+
+
+def _read_meminfo() -> float:
+    """
+    Read memory usage from /proc/meminfo.
+    
+    Returns:
+        float: Memory usage (%)
+    """
+    meminfo = {}
+    with open('/proc/meminfo') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            meminfo[key] = int(value.split()[0])
+    
+    total = meminfo.get('MemTotal', 0)
+    if not total:
+        return 50.0
+    available = meminfo.get('MemAvailable', meminfo.get('MemFree', 0))
+    return 100.0 * (total - available) / total
+
+
+def _read_net_dev() -> float:
+    """
+    Read network usage from /proc/net/dev.
+    
+    Returns:
+        float: Network usage (%) of a 1 Gbps link since the previous call
+               (0.0 on the first call)
+    """
+    global _last_net_sample
+    
+    total_bytes = 0
+    with open('/proc/net/dev') as f:
+        # Skip the two header lines
+        for line in f.readlines()[2:]:
+            iface, _, data = line.partition(':')
+            if iface.strip() == 'lo':
+                continue
+            fields = data.split()
+            # Field 0 is received bytes, field 8 is transmitted bytes
+            total_bytes += int(fields[0]) + int(fields[8])
+    
+    now = time.monotonic()
+    previous = _last_net_sample
+    _last_net_sample = (now, total_bytes)
+    if previous is None or now <= previous[0]:
+        return 0.0
+    
+    bits_per_second = (total_bytes - previous[1]) * 8 / (now - previous[0])
+    network_capacity_bits = 1000 * 1000 * 1000  # 1 Gbps in bits
+    return min(100.0, bits_per_second / network_capacity_bits * 100)
+
+
+# How often the background sampler refreshes the psutil readings (seconds)
+RESOURCE_SAMPLE_INTERVAL = 2.0
+
+# Longest a caller waits for the sampler's first reading before falling back (seconds)
+RESOURCE_WARMUP_TIMEOUT = 1.0
+
+# Background sampler task, the event it sets after its first attempt,
+# and its latest (cpu, memory, network) reading
+_resource_sampler: Optional[asyncio.Task] = None
+_resource_first_attempt: Optional[asyncio.Event] = None
+_latest_resources: Optional[Tuple[float, float, float]] = None
+
+
+def _sample_resources(previous: Tuple[float, Any]) -> Tuple[Tuple[float, float, float], Tuple[float, Any]]:
+    """
+    Take one non-blocking psutil reading.
+    
+    Args:
+        previous: (timestamp, net_io_counters) of the previous reading
+        
+    Returns:
+        Tuple of the (cpu, memory, network) usage and the new previous reading
+    """
+    # cpu_percent(None) compares against the previous call instead of sleeping
+    cpu_usage = psutil.cpu_percent(None)
+    memory_usage = psutil.virtual_memory().percent
+    
+    # Get network usage (percent of capacity, estimated)
+    # This is an approximation as we don't know the maximum bandwidth
+    now = time.monotonic()
+    net = psutil.net_io_counters()
+    elapsed = max(now - previous[0], 1e-6)
+    bytes_sent = net.bytes_sent - previous[1].bytes_sent
+    bytes_recv = net.bytes_recv - previous[1].bytes_recv
+    bytes_total = (bytes_sent + bytes_recv) * 2  # Multiply by 2 to convert to bits
+    
+    # Estimate network usage as percentage of a typical 1Gbps link
+    # Adjust this based on your actual network capacity
+    network_capacity_bits = 1000 * 1000 * 1000  # 1 Gbps in bits
+    network_usage = min(100, (bytes_total / elapsed) / (network_capacity_bits / 100))
+    
+    return (cpu_usage, memory_usage, network_usage), (now, net)
+
+
+async def _run_resource_sampler(first_attempt: asyncio.Event) -> None:
+    """
+    Refresh _latest_resources every RESOURCE_SAMPLE_INTERVAL seconds.
+    
+    Args:
+        first_attempt: Event set once the first reading has been tried
+    """
+    global _latest_resources
+    
+    try:
+        # Prime the CPU and network counters, then warm up briefly for the first reading
+        psutil.cpu_percent(None)
+        previous = (time.monotonic(), psutil.net_io_counters())
+        await asyncio.sleep(0.5)
+        
+        while True:
+            try:
+                _latest_resources, previous = _sample_resources(previous)
+            except Exception as e:
+                logger.error(f"Error sampling server resources: {e}")
+            first_attempt.set()
+            await asyncio.sleep(RESOURCE_SAMPLE_INTERVAL)
+    except Exception as e:
+        logger.error(f"Resource sampler stopped: {e}")
+    finally:
+        # Release waiting callers if priming failed or the task was cancelled
+        first_attempt.set()
+
+
 async def get_server_resources() -> Tuple[float, float, float]:
     """
     Get current server resource usage (CPU, memory, network).
@@ -421,70 +793,40 @@ async def get_server_resources() -> Tuple[float, float, float]:
     Returns:
         Tuple[float, float, float]: CPU usage (%), memory usage (%), network usage (%)
     """
+    global _resource_sampler, _resource_first_attempt
+    
     if PSUTIL_AVAILABLE:
         try:
-            # Run intensive operations in a thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
-            
-            # Get CPU usage (percent)
-            cpu_usage = await loop.run_in_executor(None, psutil.cpu_percent, 1)
+            # Readings come from a background sampler, so this call never blocks
+            loop = asyncio.get_running_loop()
+            if (_resource_sampler is None or _resource_sampler.done()
+                    or _resource_sampler.get_loop() is not loop):
+                _resource_first_attempt = asyncio.Event()
+                _resource_sampler = loop.create_task(_run_resource_sampler(_resource_first_attempt))
             
-            # Get memory usage (percent)
-            memory = await loop.run_in_executor(None, psutil.virtual_memory)
-            memory_usage = memory.percent
+            # Only the first calls wait, and only briefly, for the warm-up reading;
+            # a failing or stalled sampler falls through to the fallback below
+            if _latest_resources is None:
+                try:
+                    await asyncio.wait_for(_resource_first_attempt.wait(), RESOURCE_WARMUP_TIMEOUT)
+                except asyncio.TimeoutError:
+                    logger.warning("Timed out waiting for the first resource reading, using fallback")
             
-            # Get network usage (percent of capacity, estimated)
-            # This is an approximation as we don't know the maximum bandwidth
-            net_before = await loop.run_in_executor(None, psutil.net_io_counters)
-            await asyncio.sleep(0.5)
-            net_after = await loop.run_in_executor(None, psutil.net_io_counters)
-            
-            # Calculate bytes per second
-            bytes_sent = net_after.bytes_sent - net_before.bytes_sent
-            bytes_recv = net_after.bytes_recv - net_before.bytes_recv
-            bytes_total = (bytes_sent + bytes_recv) * 2  # Multiply by 2 to convert to bits
-            
-            # Estimate network usage as percentage of a typical 1Gbps link
-            # Adjust this based on your actual network capacity
-            network_capacity_bits = 1000 * 1000 * 1000  # 1 Gbps in bits
-            network_usage = min(100, (bytes_total / 0.5) / (network_capacity_bits / 100))
-            
-            return cpu_usage, memory_usage, network_usage
+            if _latest_resources is not None:
+                return _latest_resources
             
         except Exception as e:
             logger.error(f"Error getting server resources: {e}")
     
     # Fallback to basic system calls if psutil is not available
     try:
-        # Try to get CPU usage with basic commands
+        # Read resource usage without psutil
         if platform.system() == "Linux":
-            # Use top command to get CPU usage
-            proc = await asyncio.create_subprocess_shell(
-                "top -b -n 1 | grep '%Cpu' | awk '{print $2}'",
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            stdout, _ = await proc.communicate()
-            cpu_usage = float(stdout.decode().strip()) if stdout else 50.0
-            
-            # Use free command to get memory usage
-            proc = await asyncio.create_subprocess_shell(
-                "free | grep Mem | awk '{print $3/$2 * 100.0}'",
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            stdout, _ = await proc.communicate()
-            memory_usage = float(stdout.decode().strip()) if stdout else 50.0
-            
-            # Use ifstat to get network usage (if available)
-            proc = await asyncio.create_subprocess_shell(
-                "ifstat 1 1 | tail -n 1 | awk '{print $1+$2}'",
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            stdout, _ = await proc.communicate()
-            network_kbps = float(stdout.decode().strip()) if stdout and stdout.decode().strip() else 5000
-            network_usage = min(100, network_kbps / 100000 * 100)  # Assuming 1Gbps max
+            # Read /proc directly instead of spawning top/free/ifstat
+            loop = asyncio.get_event_loop()
+            cpu_usage = await loop.run_in_executor(None, _read_proc_stat)
+            memory_usage = await loop.run_in_executor(None, _read_meminfo)
+            network_usage = await loop.run_in_executor(None, _read_net_dev)
             
             return cpu_usage, memory_usage, network_usage
             
@@ -501,6 +843,12 @@ async def get_server_resources() -> Tuple[float, float, float]:
         return 50.0, 50.0, 30.0
 
 
+@lru_cache(maxsize=128)
+def _resolve_executable(name: str) -> str:
+    """Resolve a command name to its absolute path once; unknown names pass through."""
+    return shutil.which(name) or name
+
+
 def execute_command(command: List[str], raise_on_error: bool = True) -> subprocess.CompletedProcess:
     """
     Execute a shell command and return the result.
@@ -512,13 +860,17 @@ def execute_command(command: List[str], raise_on_error: bool = True) -> subproce
     Returns:
         subprocess.CompletedProcess: Command execution result
     """
+    # An absolute executable path and close_fds=False let CPython use
+    # posix_spawn instead of fork+exec (Python's own fds are non-inheritable)
+    argv = [_resolve_executable(command[0]), *command[1:]] if command else command
     try:
         return subprocess.run(
-            command,
+            argv,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
-            check=raise_on_error
+            check=raise_on_error,
+            close_fds=False
         )
     except subprocess.CalledProcessError as e:
         if raise_on_error:
@@ -527,34 +879,8 @@ def execute_command(command: List[str], raise_on_error: bool = True) -> subproce
         return e
 
 
-def generate_challenge(difficulty: int = 1) -> Tuple[str, str]:
-    """
-    Generate a JavaScript challenge for client verification.
-    
-    Args:
-        difficulty: Challenge difficulty level (1-5)
-        
-    Returns:
-        Tuple[str, str]: JavaScript challenge code and expected answer
-    """
-    # Scale iterations based on difficulty (1-5)
-    iterations = int(10000 * difficulty)
-    
-    # Generate random values for the challenge
-    a = random.randint(10000, 99999)
-    b = random.randint(10000, 99999)
-    c = random.randint(10000, 99999)
-    
-    # Generate a unique salt for this challenge
-    salt = os.urandom(8).hex()
-    
-    # Create expected answer
-    answer_base = f"{a}{b}{c}{salt}"
-    expected_answer = hashlib.sha256(answer_base.encode()).hexdigest()
-    
-    # Create JavaScript challenge that will compute the same hash
-    # More difficult challenges use more iterations and operations
-    js_challenge = f"""
+# JavaScript challenge template, filled in by generate_challenge with str.format
+_JS_CHALLENGE_TEMPLATE = """
     function solveChallenge() {{
         // Challenge parameters
         const a = {a};
@@ -591,6 +917,37 @@ def generate_challenge(difficulty: int = 1) -> Tuple[str, str]:
         submitChallengeResponse(result);
     }});
     """
+
+
+def generate_challenge(difficulty: int = 1) -> Tuple[str, str]:
+    """
+    Generate a JavaScript challenge for client verification.
+    
+    Args:
+        difficulty: Challenge difficulty level (1-5)
+        
+    Returns:
+        Tuple[str, str]: JavaScript challenge code and expected answer
+    """
+    # Scale iterations based on difficulty (1-5)
+    iterations = int(10000 * difficulty)
+    
+    # Draw the three values and the salt from one CSPRNG read
+    a, b, c, salt_bytes = struct.unpack('<III8s', os.urandom(20))
+    a = 10000 + a % 90000
+    b = 10000 + b % 90000
+    c = 10000 + c % 90000
+    salt = salt_bytes.hex()
+    
+    # Create expected answer. This must stay SHA-256: the browser computes it
+    # with WebCrypto, which has no BLAKE2. hashlib uses OpenSSL, whose SHA-256
+    # picks up SHA-NI on CPUs that have it.
+    answer_base = f"{a}{b}{c}{salt}"
+    expected_answer = hashlib.sha256(answer_base.encode('ascii')).hexdigest()
+    
+    # Create JavaScript challenge that will compute the same hash
+    # More difficult challenges use more iterations and operations
+    js_challenge = _JS_CHALLENGE_TEMPLATE.format(a=a, b=b, c=c, salt=salt, iterations=iterations)
     
     return js_challenge, expected_answer
 
@@ -606,25 +963,16 @@ def verify_challenge_response(response: str, expected: str) -> bool:
     Returns:
         bool: True if the response is correct, False otherwise
     """
-    # Simple string comparison (constant time comparison would be better in production)
-    return response is not None and response == expected
+    # Constant-time comparison so the answer cannot be recovered by timing
+    try:
+        return response is not None and hmac.compare_digest(response, expected)
+    except TypeError:
+        # Non-ASCII or non-string responses can never match the hex digest
+        return False
 
 
-def get_client_ip_from_request(request: Any) -> str:
-    """
-    Extract the real client IP from any request object.
-    Works with Flask, FastAPI, Django, etc.
-    
-    Args:
-        request: Any request object
-        
-    Returns:
-        str: The real client IP address
-    """
-    # Check for custom attribute first (might have been set by middleware)
-    if hasattr(request, 'real_ip'):
-        return request.real_ip
-    
+def _generic_extract(request: Any) -> Tuple[str, Any]:
+    """Probe any request object for its remote address and forwarded-for value."""
     # If using Flask or similar
     if hasattr(request, 'remote_addr'):
         remote_addr = request.remote_addr
@@ -663,14 +1011,76 @@ def get_client_ip_from_request(request: Any) -> str:
     elif hasattr(request, 'META'):
         forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR') or request.META.get('HTTP_X_REAL_IP')
     
+    return remote_addr, forwarded_for
+
+
+def _flask_extract(request: Any) -> Tuple[str, Any]:
+    """Extract from Flask/FastAPI-style requests (remote_addr plus headers.get)."""
+    headers = request.headers
+    return request.remote_addr, headers.get('X-Forwarded-For') or headers.get('X-Real-IP')
+
+
+def _aiohttp_extract(request: Any) -> Tuple[str, Any]:
+    """Extract from aiohttp-style requests (remote plus headers.get)."""
+    headers = request.headers
+    return request.remote, headers.get('X-Forwarded-For') or headers.get('X-Real-IP')
+
+
+def _django_extract(request: Any) -> Tuple[str, Any]:
+    """Extract from Django-style requests (everything in META)."""
+    meta = request.META
+    return meta.get('REMOTE_ADDR', ''), meta.get('HTTP_X_FORWARDED_FOR') or meta.get('HTTP_X_REAL_IP')
+
+
+def _select_ip_extractor(request: Any) -> Callable[[Any], Tuple[str, Any]]:
+    """Pick the extractor for a request type by probing one instance."""
+    has_header_get = hasattr(getattr(request, 'headers', None), 'get')
+    if hasattr(request, 'remote_addr') and has_header_get:
+        return _flask_extract
+    if hasattr(request, 'remote') and has_header_get:
+        return _aiohttp_extract
+    if (hasattr(request, 'META') and not hasattr(request, 'remote_addr')
+            and not hasattr(request, 'remote')):
+        return _django_extract
+    return _generic_extract
+
+
+# Extractor per request type, selected on the first request of each type
+_IP_EXTRACTORS: Dict[type, Callable[[Any], Tuple[str, Any]]] = {}
+
+
+def get_client_ip_from_request(request: Any) -> str:
+    """
+    Extract the real client IP from any request object.
+    Works with Flask, FastAPI, Django, etc.
+    
+    Args:
+        request: Any request object
+        
+    Returns:
+        str: The real client IP address
+    """
+    # Check for custom attribute first (might have been set by middleware)
+    if hasattr(request, 'real_ip'):
+        return request.real_ip
+    
+    # Dispatch on the request type; the attribute probing runs once per type
+    extractor = _IP_EXTRACTORS.get(type(request))
+    if extractor is None:
+        extractor = _IP_EXTRACTORS[type(request)] = _select_ip_extractor(request)
+    try:
+        remote_addr, forwarded_for = extractor(request)
+    except AttributeError:
+        # This instance differs from the one the extractor was chosen for
+        remote_addr, forwarded_for = _generic_extract(request)
+    
     # Process the forwarded-for header if present
     if forwarded_for:
         # Take the first IP in the chain (client IP)
         try:
-            # If it's a string with multiple IPs, split and take the first
-            if isinstance(forwarded_for, str) and ',' in forwarded_for:
-                forwarded_ips = [ip.strip() for ip in forwarded_for.split(',')]
-                client_ip = forwarded_ips[0]
+            # If it's a string, take everything before the first comma
+            if isinstance(forwarded_for, str):
+                client_ip = forwarded_for.split(',', 1)[0].strip()
             else:
                 client_ip = forwarded_for
             
@@ -167,6 +167,7 @@ except ImportError:
 # Import Cloudflare integration
 try:
     from ddos_protection.network.cloudflare import init_cloudflare_integration, cf_client, CLOUDFLARE_ENABLED
+    from ddos_protection.network.cloudflare.api import get_background_loop
     CLOUDFLARE_INTEGRATION_AVAILABLE = True
     print(f"Cloudflare integration module found. Enabled: {CLOUDFLARE_ENABLED}")
 except ImportError as e:
@@ -434,6 +435,13 @@ if DDOS_PROTECTION_AVAILABLE:
                         # Start in thread
                         threading.Thread(target=start_ddos_in_thread, daemon=True).start()
                         
+                    # Apply the OPTIONS-request patches; importing the package no longer does
+                    try:
+                        from ddos_protection.monitoring import options_patch
+                        options_patch.init()
+                    except Exception as e:
+                        logger.error(f"Failed to apply OPTIONS patch: {e}")
+                        
                     # Initialize Cloudflare integration (ONLY USE CLOUDFLARE)
                     try:
                         # Set cloudflare exclusive mode
@@ -578,16 +586,17 @@ def early_ip_rejection():
                 if cache_entry['count'] > 2000 and CLOUDFLARE_INTEGRATION_AVAILABLE:
                     try:
                         if cf_client:
-                            # Create task to ban in Cloudflare
-                            loop = asyncio.new_event_loop()
-                            asyncio.set_event_loop(loop)
-                            try:
-                                loop.run_until_complete(cf_client.block_ip(real_ip, "Excessive request volume", 86400))
-                                logger.warning(f"Banned high-volume IP in Cloudflare: {real_ip}")
-                            finally:
-                                loop.close()
+                            # Ban on the shared background loop so the client's pooled session is reused
+                            future = asyncio.run_coroutine_threadsafe(
+                                cf_client.block_ip(real_ip, "Excessive request volume", 86400),
+                                get_background_loop()
+                            )
+                            future.result(10.0)
+                            logger.warning(f"Banned high-volume IP in Cloudflare: {real_ip}")
                     except ImportError:
                         logger.error("Could not import Cloudflare client")
+                    except Exception as e:
+                        logger.error(f"Error banning high-volume IP in Cloudflare: {e}")
                 
                 return jsonify({"error": "Too Many Requests"}), 429
             
@@ -1232,15 +1241,16 @@ def add_cors_headers(response):
     """Add CORS headers and additional security headers to all responses"""
     # Allow client cookies to be sent with requests - only for specific origins
     if request.method == 'OPTIONS':
-        response.headers.add('Access-Control-Allow-Origin', request.headers.get('Origin', '*'))
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,X-Device-Fingerprint,X-Requested-With,X-CSRF-Token')
-        response.headers.add('Access-Control-Allow-Methods', 'GET,POST,PUT,DELETE,OPTIONS')
-        response.headers.add('Access-Control-Allow-Credentials', 'true')
-        response.headers.add('Access-Control-Max-Age', '3600') # Cache preflight for 1 hour
+        # Assign rather than add so blueprint-level CORS values are replaced, not duplicated
+        response.headers['Access-Control-Allow-Origin'] = request.headers.get('Origin', '*')
+        response.headers['Access-Control-Allow-Headers'] = 'Content-Type,Authorization,X-Device-Fingerprint,X-Requested-With,X-CSRF-Token'
+        response.headers['Access-Control-Allow-Methods'] = 'GET,POST,PUT,DELETE,OPTIONS'
+        response.headers['Access-Control-Allow-Credentials'] = 'true'
+        response.headers['Access-Control-Max-Age'] = '3600' # Cache preflight for 1 hour
     elif request.headers.get('Origin'):
         # For non-OPTIONS requests, only set the CORS headers if Origin is present
-        response.headers.add('Access-Control-Allow-Origin', request.headers.get('Origin'))
-        response.headers.add('Access-Control-Allow-Credentials', 'true')
+        response.headers['Access-Control-Allow-Origin'] = request.headers.get('Origin')
+        response.headers['Access-Control-Allow-Credentials'] = 'true'
     
     # Add security headers if not already present
     if 'Content-Security-Policy' not in response.headers: